@@ -1,10 +1,12 @@
 # Standard imports:
 from logger import logging
-import time
+import asyncio
+import threading
 from datetime import datetime, timedelta
 
 # Third party imports:
 from alpaca.trading.client import TradingClient
+from alpaca.trading.stream import TradingStream
 from alpaca.data import CryptoHistoricalDataClient
 from alpaca.data.requests import CryptoBarsRequest
 from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
@@ -12,6 +14,12 @@ from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest, StopO
 from alpaca.trading.enums import OrderSide, TimeInForce, OrderStatus, QueryOrderStatus
 
 # Local imports:
+from backtesting.indicators import warm_up
+from alpaca_strategies.bar_stream import BarStream, BarBuffer, STREAM_URL
+from backtesting.bar_sources import agg_minutes
+from live_trading.order_tracker import OrderTracker, alpaca_order_state
+from live_trading.account_state import AccountState, alpaca_balances
+from live_trading.runtime import BotRuntime
 from alpaca_strategies.alpaca_keys import alpaca_live_keyid, alpaca_live_secret
 from alpaca_strategies.alpaca_keys import alpaca_paper_keyid, alpaca_paper_secret
 from helper_functions import round_down
@@ -21,19 +29,34 @@ LIVE = False
 SYM = 'ETH/USD'
 
 class AlpacaBot:
-    def __init__(self, symbol, timeframe):
+    def __init__(self, symbol, timeframe, indicators=None, buffer_size=1000):
         # Variables:
         self.data_symbol = symbol
         self.trade_symbol = ''.join(symbol.split('/'))
         self.timeframe = timeframe
+        self.bar_minutes = agg_minutes(timeframe)
 
         # Price information
         self.crypto_data_client = CryptoHistoricalDataClient()
-        self.hist_data = self.get_historical_data()
+        self.hist_data = self.get_historical_data(start=datetime.utcnow() - timedelta(minutes=buffer_size * self.bar_minutes))
+        closed_bars = self.closed_bars(self.hist_data)
+        if not len(closed_bars):
+            raise ValueError(f'No closed {self.bar_minutes} minute bars of {symbol} in the last {buffer_size} periods.')
         self.current_price = self.hist_data.iloc[-1]['close']
+        self.last_bar_time = closed_bars.index[-1]
+        self.bars = BarBuffer(buffer_size)  # Recent closed bars, updated in place by stream()
+        self.bars.extend(closed_bars)
+
+        # Streaming indicators (see backtesting/indicators.py), fed the closed history once:
+        self.indicators = warm_up(indicators, closed_bars) if indicators else dict()
 
         # Account information:
         self.trading_client = self.connect_account()
+        self.orders = OrderTracker(lambda order_id: alpaca_order_state(self.trading_client.get_order_by_id(order_id)),
+                                   self.trading_client.cancel_order_by_id)
+        self.trade_updates = None
+        self.account = AccountState(lambda: alpaca_balances(self.trading_client), self.orders)  # Fills applied as they come
+        self.account.reconcile(force=True)
         self.cash_on_hand, self.crypto_on_hand, self.open_position = self.calculate_balances()
         self.affordable_shares = round_down(self.cash_on_hand / self.current_price, 3)
 
@@ -49,7 +72,7 @@ class AlpacaBot:
         if start:
             start = start
         else:
-            start = (datetime.now() - timedelta(hours=1))
+            start = (datetime.utcnow() - timedelta(hours=1))  # Alpaca reads naive times as UTC
 
         request_params = CryptoBarsRequest(
             symbol_or_symbols=[self.data_symbol],
@@ -62,26 +85,121 @@ class AlpacaBot:
         bars.index = [x.tz_localize(None) for x in bars.index]
         return bars
 
-    def check_open_positions(self):
-        return True if self.trading_client.get_all_positions() else False
+    def closed_bars(self, bars):
 
-    def get_crypto_onhand(self):
-        positions = self.trading_client.get_all_positions()
-        if not positions:
-            return 0
-        else:
-            return positions[0].qty
+        '''Drops the newest bar if it is still forming. Indicators and the buffer only ever see closed bars.'''
+
+        return bars[bars.index + timedelta(minutes=self.bar_minutes) <= datetime.utcnow()]
+
+    def update_indicators(self):
+
+        '''Fetch only the bars since the last update and feed the ones that closed to the indicators.'''
+
+        new_bars = self.get_historical_data(start=self.last_bar_time)
+        if len(new_bars):
+            self.current_price = new_bars.iloc[-1]['close']
+        new_bars = self.closed_bars(new_bars[new_bars.index > self.last_bar_time])
+        if len(new_bars):
+            warm_up(self.indicators, new_bars)
+            self.bars.extend(new_bars)
+            self.last_bar_time = new_bars.index[-1]
+        return self.indicators
+
+    async def refresh(self, runtime):
+
+        '''New bars for the indicators, fetched on a BotRuntime, and the balances from the cached account state.'''
+
+        await runtime.call(self.update_indicators)
+        self.cash_on_hand, self.crypto_on_hand, self.open_position = self.calculate_balances()
+        self.affordable_shares = round_down(self.cash_on_hand / self.current_price, 3)
 
-    def get_cash_onhand(self):
-        return self.trading_client.get_account().cash
+    async def step(self, runtime, strategy):
+
+        '''
+        Refreshes and calls strategy(bot), which may place orders, on the runtime's thread pool. Schedule it at
+        every candle close with runtime.every_bar(minutes, bot.step, runtime, strategy), and the balance
+        reconcile with bot.account.schedule(runtime).
+        '''
+
+        await self.refresh(runtime)
+        return await runtime.call(strategy, self)
+
+    async def on_bar(self, symbol, buffer):
+
+        '''Feed a bar that just closed on the stream to the indicators. No REST call is made.'''
+
+        bar = buffer.last_bar
+        for indicator in self.indicators.values():
+            indicator.update_bar(*bar)
+        self.last_bar_time = buffer.last_time
+        self.current_price = bar[3]
+        self.affordable_shares = round_down(self.cash_on_hand / self.current_price, 3)
+
+    def stream(self, strategy=None, url=STREAM_URL):
+
+        '''
+        A BarStream that keeps self.bars, the indicators and current_price up to date and calls
+        strategy(bot) as soon as each bar closes. Run it with asyncio.run(bot.stream(strategy).run()).
+
+        The strategy runs on a worker thread, so orders it places and waits on never block the stream's
+        event loop, and the order tracker polls and cancels them from its own thread. The balances are
+        reconciled on a BotRuntime that runs alongside the stream, as Supervisor.run_forever does.
+        '''
+
+        key, secret = (alpaca_live_keyid, alpaca_live_secret) if LIVE else (alpaca_paper_keyid, alpaca_paper_secret)
+        stream = BarStream([self.data_symbol], self.timeframe, key, secret, url=url)
+        stream.buffers[self.data_symbol] = self.bars
+        stream.on_bar(self.on_bar)
+        runtime = BotRuntime()
+        self.account.schedule(runtime)
+        stream.add_task(runtime.run)
+        if strategy:
+            async def run_strategy(symbol, buffer):
+                await asyncio.to_thread(strategy, self)
+            stream.on_bar(run_strategy)
+        return stream
 
     def calculate_balances(self):
-        cash_on_hand = float(self.get_cash_onhand())
-        crypto_on_hand = float(self.get_crypto_onhand())
-        open_position = self.check_open_positions()
+
+        '''Cash, crypto on hand and open position from the cached account state. No API call is made.'''
+
+        cash_on_hand = self.account.cash
+        crypto_on_hand = self.account.position(self.trade_symbol)
+        open_position = crypto_on_hand > 0
         return cash_on_hand, crypto_on_hand, open_position
 
-    def limit_buy_order(self, seconds_toCancel=30):
+    def listen_trade_updates(self):
+
+        '''Pushes order updates from Alpaca's trade_updates websocket to the order tracker, on a background thread.'''
+
+        key, secret = (alpaca_live_keyid, alpaca_live_secret) if LIVE else (alpaca_paper_keyid, alpaca_paper_secret)
+        stream = TradingStream(key, secret, paper=not LIVE)
+        stream.subscribe_trade_updates(self.orders.alpaca_trade_updates)
+        threading.Thread(target=stream.run, name='trade-updates', daemon=True).start()
+        return stream
+
+    def track_order(self, order, seconds_toCancel=30, wait=True):
+
+        '''
+        Follows a submitted order through trade updates, polling as a fallback, and cancels it after
+        seconds_toCancel. Returns the order id once it finished, or its OrderHandle right away if not wait.
+        '''
+
+        if self.trade_updates is None:
+            self.trade_updates = self.listen_trade_updates()
+        handle = self.orders.track(order.id, timeout=seconds_toCancel, symbol=order.symbol.replace('/', ''),
+                                   side=getattr(order.side, 'value', order.side))
+        if not wait:
+            return handle
+        state = handle.result()
+        if handle.filled:
+            logging.info('Order filled!')
+        else:
+            logging.warning(f"Order {state['status']}, {state['filled_qty']} shares filled.")
+        self.cash_on_hand, self.crypto_on_hand, self.open_position = self.calculate_balances()
+        return order.id
+
+    def limit_buy_order(self, seconds_toCancel=30, wait=True):
 
         try:
             limit_order_data = LimitOrderRequest(
@@ -96,29 +214,19 @@ class AlpacaBot:
             limit_order = self.trading_client.submit_order(order_data=limit_order_data)
             logging.info(f'Placed order for {self.affordable_shares} shares at ${self.current_price:.2}...')
             logging.info('Waiting for order to fill...')
-
-            # orders that satisfy params
-            order_params = GetOrdersRequest(status=QueryOrderStatus.OPEN, side=OrderSide.BUY)
-            start_time = time.time()
-            while len(self.trading_client.get_orders(filter=order_params)) > 0:
-                # Cancel order if it takes too long to fill
-                if time.time() - start_time > seconds_toCancel:
-                    logging.warning('Order took too long to fill. Canceling order...')
-                    self.trading_client.cancel_order_by_id(limit_order.id)
-                    break
-                time.sleep(3)
-            logging.info('Order filled!')
-            return limit_order.id
+            return self.track_order(limit_order, seconds_toCancel, wait)
         except Exception as e:
             logging.error(f'ERROR: Attempted order for {self.affordable_shares} shares at ${self.current_price:.2}')
             logging.error(e)
             return None
 
     def close_all_positions(self):
-        self.trading_client.close_all_positions(cancel_orders=True)
+        for response in self.trading_client.close_all_positions(cancel_orders=True):
+            if hasattr(response.body, 'id'):
+                self.track_order(response.body, seconds_toCancel=None, wait=False)  # Fills reach the account state
         logging.info('Closed all positions!')
 
-    def oto_buy_order(self, stop_price, limit_price=None, side='stop_loss', seconds_toCancel=30):
+    def oto_buy_order(self, stop_price, limit_price=None, side='stop_loss', seconds_toCancel=30, wait=True):
 
         '''
 
@@ -159,16 +267,7 @@ class AlpacaBot:
             buy_order = self.trading_client.submit_order(order_data=order_params)
             logging.info(f'Placed order for {self.affordable_shares} shares at ${self.current_price:.2}...')
             logging.info('Waiting for order to fill...')
-            start_time = time.time()
-            while len(self.trading_client.get_orders(filter=order_params)) > 0:
-                # Cancel order if it takes too long to fill
-                if time.time() - start_time > seconds_toCancel:
-                    logging.warning('Order took too long to fill. Canceling order...')
-                    self.trading_client.cancel_order_by_id(buy_order.id)
-                    break
-                time.sleep(3)
-            logging.info('Order filled!')
-            return buy_order.id
+            return self.track_order(buy_order, seconds_toCancel, wait)
         except Exception as e:
             logging.error(f'ERROR: Attempted order for {self.affordable_shares} shares at ${self.current_price:.2}')
             logging.error(e)
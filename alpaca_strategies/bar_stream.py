@@ -0,0 +1,302 @@
+# Standard imports:
+from logger import logging
+import json
+import asyncio
+from datetime import datetime, timezone
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+import websockets
+
+# Local imports:
+from backtesting.bar_sources import agg_minutes
+
+# Constants:
+STREAM_URL = 'wss://stream.data.alpaca.markets/v1beta3/crypto/us'
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def _to_seconds(timestamp:str):
+    return int(datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp())
+
+
+def _to_iso(seconds:int):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class BarBuffer:
+
+    '''
+    The most recent bars of one symbol in fixed-size numpy arrays. A new bar overwrites the oldest, so
+    appending never allocates and frame() only builds a DataFrame when a strategy asks for one.
+    '''
+
+    def __init__(self, capacity:int=1000):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype='int64')  # Bar start, unix seconds
+        self.values = np.zeros((capacity, len(BAR_COLUMNS)))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp:int, open:float, high:float, low:float, close:float, volume:float=0):
+        i = self.count % self.capacity
+        self.timestamps[i] = timestamp
+        self.values[i] = open, high, low, close, volume
+        self.count += 1
+
+    def extend(self, df):
+
+        '''Append every bar of an OHLCV DataFrame with a datetime index, oldest first.'''
+
+        timestamps = df.index.values.astype('datetime64[s]').astype('int64')
+        for timestamp, bar in zip(timestamps, df[BAR_COLUMNS].to_numpy()):
+            self.append(timestamp, *bar)
+
+    def _order(self):
+        if self.count <= self.capacity:
+            return np.arange(self.count)
+        return (np.arange(self.capacity) + self.count) % self.capacity
+
+    def column(self, col:str):
+
+        '''One column, oldest bar first.'''
+
+        return self.values[self._order(), BAR_COLUMNS.index(col)]
+
+    def frame(self):
+        order = self._order()
+        index = pd.DatetimeIndex(pd.to_datetime(self.timestamps[order], unit='s'), name='timestamp')
+        return pd.DataFrame(self.values[order], index=index, columns=BAR_COLUMNS)
+
+    @property
+    def last_bar(self):
+
+        '''open, high, low, close and volume of the newest bar.'''
+
+        return self.values[(self.count - 1) % self.capacity] if self.count else None
+
+    @property
+    def last_close(self):
+        return self.values[(self.count - 1) % self.capacity, 3] if self.count else None
+
+    @property
+    def last_time(self):
+        return pd.Timestamp(self.timestamps[(self.count - 1) % self.capacity], unit='s') if self.count else None
+
+
+class BarAggregator:
+
+    '''
+    Builds bars of any length from the stream's one-minute bars. A bar is emitted as soon as the minute bar
+    that ends its period arrives, or, if that minute had no trades, when the first minute of a later
+    period does.
+    '''
+
+    def __init__(self, minutes:int):
+        self.seconds = minutes * 60
+        self.bar = None  # [start, open, high, low, close, volume] of the period being built
+
+    def update(self, timestamp:int, open:float, high:float, low:float, close:float, volume:float):
+
+        '''Feed one minute bar. Returns the finished bars, oldest first.'''
+
+        finished = []
+        start = timestamp - timestamp % self.seconds
+        if self.bar and self.bar[0] != start:
+            finished.append(tuple(self.bar))
+            self.bar = None
+        if self.bar is None:
+            self.bar = [start, open, high, low, close, volume]
+        else:
+            self.bar[2] = max(self.bar[2], high)
+            self.bar[3] = min(self.bar[3], low)
+            self.bar[4] = close
+            self.bar[5] += volume
+        if timestamp + 60 >= start + self.seconds:
+            finished.append(tuple(self.bar))
+            self.bar = None
+        return finished
+
+
+class BarStream:
+
+    '''
+    Live bars from Alpaca's crypto market data websocket, kept in a BarBuffer per symbol.
+
+    Minute bars are aggregated to the stream's timeframe and every handler added with on_bar is awaited
+    with (symbol, buffer) as soon as a bar closes, so a strategy runs once per bar without any REST call.
+    url can point at a ReplayServer instead of Alpaca.
+
+        stream = BarStream(['ETH/USD', 'BTC/USD'], TimeFrame.Hour, key, secret)
+        stream.on_bar(handler)
+        asyncio.run(stream.run())
+    '''
+
+    def __init__(self, symbols, timeframe=1, key:str=None, secret:str=None, url:str=STREAM_URL, capacity:int=1000):
+        self.symbols = list(symbols)
+        self.minutes = agg_minutes(timeframe)
+        self.key = key
+        self.secret = secret
+        self.url = url
+        self.buffers = {symbol: BarBuffer(capacity) for symbol in self.symbols}
+        self.aggregators = {symbol: BarAggregator(self.minutes) for symbol in self.symbols}
+        self.handlers = []
+        self.tasks = []
+
+    def on_bar(self, handler):
+
+        '''Adds an async handler(symbol, buffer), called after each closed bar is appended.'''
+
+        self.handlers.append(handler)
+        return handler
+
+    def add_task(self, task):
+
+        '''Adds a coroutine function, e.g. a BotRuntime's run, started with the stream and cancelled when it stops.'''
+
+        self.tasks.append(task)
+        return task
+
+    def seed(self, symbol:str, df):
+
+        '''
+        Fills a symbol's buffer with historical bars, e.g. from one REST request at startup. Closed bars only:
+        streamed bars are appended after the last seeded one, never in place of it.
+        '''
+
+        self.buffers[symbol].extend(df)
+
+    async def handle_message(self, message:dict):
+        if message.get('T') != 'b' or message.get('S') not in self.buffers:
+            return
+        symbol = message['S']
+        buffer = self.buffers[symbol]
+        timestamp = _to_seconds(message['t'])
+        for bar in self.aggregators[symbol].update(timestamp, message['o'], message['h'], message['l'],
+                                                   message['c'], message['v']):
+            if buffer.count and pd.Timestamp(bar[0], unit='s') <= buffer.last_time:
+                continue  # Already seeded from the historical bars
+            buffer.append(*bar)
+            for handler in self.handlers:
+                await handler(symbol, buffer)
+
+    async def _session(self):
+        async with websockets.connect(self.url) as websocket:
+            await websocket.recv()  # [{"T": "success", "msg": "connected"}]
+            await websocket.send(json.dumps(dict(action='auth', key=self.key, secret=self.secret)))
+            reply = json.loads(await websocket.recv())
+            if reply[0].get('T') == 'error':
+                raise ValueError(f"Stream authentication failed: {reply[0].get('msg')}")
+            await websocket.send(json.dumps(dict(action='subscribe', bars=self.symbols)))
+            logging.info(f'Streaming {self.minutes} minute bars of {", ".join(self.symbols)}...')
+            async for raw in websocket:
+                for message in json.loads(raw):
+                    await self.handle_message(message)
+
+    async def run(self, reconnect:bool=True, max_delay:float=60):
+
+        '''
+        Streams until cancelled. Dropped connections are retried with exponential backoff; without
+        reconnect, run returns when the server closes the connection, e.g. at the end of a replay.
+        '''
+
+        tasks = [asyncio.create_task(task()) for task in self.tasks]
+        delay = 1
+        try:
+            while True:
+                try:
+                    await self._session()
+                    delay = 1
+                except (OSError, websockets.ConnectionClosedError) as e:
+                    if not reconnect:
+                        raise
+                    logging.warning(f'Bar stream disconnected ({e}). Reconnecting in {delay}s...')
+                if not reconnect:
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ReplayServer:
+
+    '''
+    A local stand-in for Alpaca's crypto websocket that replays one-minute bars, for tests and dry runs.
+    It speaks the same protocol (connected, auth and subscribe replies, then lists of bar messages),
+    sends the bars of the subscribed symbols in time order every interval seconds and then closes.
+    With drop_after, the first connection is dropped without a close frame after that many minutes, and the
+    next one resumes the replay where it stopped. Every auth and subscribe request is kept in requests.
+
+        async with ReplayServer({'ETH/USD': minute_bars}) as server:
+            stream = BarStream(['ETH/USD'], 60, url=server.url)
+            await stream.run(reconnect=False)
+    '''
+
+    def __init__(self, bars:dict, interval:float=0, host:str='localhost', port:int=0, drop_after:int=None):
+        self.bars = bars
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.drop_after = drop_after
+        self.server = None
+        self.requests = []
+        self.connections = 0
+        self.sent = 0  # Minutes replayed so far, over all connections
+
+    @property
+    def url(self):
+        return f'ws://{self.host}:{self.port}'
+
+    def messages(self, symbols):
+
+        '''Bar messages of the symbols, grouped by minute.'''
+
+        rows = []
+        for symbol in symbols:
+            df = self.bars[symbol]
+            timestamps = df.index.values.astype('datetime64[s]').astype('int64')
+            for timestamp, (o, h, l, c, v) in zip(timestamps, df[BAR_COLUMNS].to_numpy()):
+                rows.append((timestamp, dict(T='b', S=symbol, o=o, h=h, l=l, c=c, v=v, t=_to_iso(timestamp))))
+        rows.sort(key=lambda row: row[0])
+        groups = dict()
+        for timestamp, message in rows:
+            groups.setdefault(timestamp, []).append(message)
+        return list(groups.values())
+
+    async def _handler(self, websocket):
+        self.connections += 1
+        await websocket.send(json.dumps([dict(T='success', msg='connected')]))
+        self.requests.append(json.loads(await websocket.recv()))  # Any key is accepted
+        await websocket.send(json.dumps([dict(T='success', msg='authenticated')]))
+        request = json.loads(await websocket.recv())
+        self.requests.append(request)
+        symbols = [symbol for symbol in request.get('bars', []) if symbol in self.bars]
+        await websocket.send(json.dumps([dict(T='subscription', bars=symbols)]))
+        for group in self.messages(symbols)[self.sent:]:
+            if self.connections == 1 and self.sent == self.drop_after:
+                websocket.transport.abort()
+                return
+            await websocket.send(json.dumps(group))
+            self.sent += 1
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
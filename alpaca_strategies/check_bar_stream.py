@@ -0,0 +1,83 @@
+# Standard imports:
+import sys
+import asyncio
+import argparse
+
+# Third party imports:
+import numpy as np
+
+# Local imports:
+from alpaca_strategies.bar_stream import BarStream, ReplayServer
+from backtesting.bar_sources import SyntheticSource
+
+# Constants:
+SYMBOLS = ['ETH/USD', 'BTC/USD']
+
+
+async def check_stream(minutes:int=60, days:int=2, seeded:int=5, drop_after:int=None, timeout:float=30):
+
+    '''
+    Replays synthetic minute bars through a ReplayServer into a BarStream seeded with the first bars of
+    ETH/USD, dropping the connection part way through. Returns a list of the failures, empty if it worked.
+    '''
+
+    minute_bars = {symbol: SyntheticSource(seed=i).bars(days * 1440, 1, '2022-01-01') for i, symbol in enumerate(SYMBOLS)}
+    expected = {symbol: df.resample(f'{minutes}min').agg(dict(open='first', high='max', low='min', close='last',
+                                                                volume='sum'))
+                for symbol, df in minute_bars.items()}
+    drop_after = days * 720 if drop_after is None else drop_after
+
+    failures = []
+    streamed = {symbol: [] for symbol in SYMBOLS}
+    done = asyncio.Event()
+    async with ReplayServer(minute_bars, drop_after=drop_after) as server:
+        stream = BarStream(SYMBOLS, minutes, 'key', 'secret', url=server.url)
+        stream.seed('ETH/USD', expected['ETH/USD'].iloc[:seeded])
+
+        @stream.on_bar
+        async def collect(symbol, buffer):
+            streamed[symbol].append(buffer.last_time)
+            if all(len(streamed[symbol]) >= len(expected[symbol]) - (seeded if symbol == 'ETH/USD' else 0)
+                   for symbol in SYMBOLS):
+                done.set()
+
+        task = asyncio.create_task(stream.run(max_delay=1))
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            failures.append(f'Timed out after {timeout}s with {[len(times) for times in streamed.values()]} bars')
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    handshake = [dict(action='auth', key='key', secret='secret'), dict(action='subscribe', bars=SYMBOLS)]
+    if server.requests[:2] != handshake:
+        failures.append(f'Handshake was {server.requests[:2]}')
+    if server.connections < 2 or server.requests[2:4] != handshake:
+        failures.append(f'Did not reconnect and subscribe again after the drop ({server.connections} connections)')
+    if streamed['ETH/USD'] and streamed['ETH/USD'][0] <= expected['ETH/USD'].index[seeded - 1]:
+        failures.append(f"Streamed {streamed['ETH/USD'][0]}, at or before the last seeded bar")
+    for symbol in SYMBOLS:
+        bars = expected[symbol].iloc[seeded if symbol == 'ETH/USD' else 0:]
+        if streamed[symbol] != list(bars.index):
+            failures.append(f'{symbol} streamed {len(streamed[symbol])} bars, not the {len(bars)} replayed')
+        elif not np.allclose(stream.buffers[symbol].frame().values, expected[symbol].values):
+            failures.append(f'{symbol} buffer differs from the resampled minute bars')
+    return failures
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Checks BarStream against a ReplayServer: the auth and subscribe '
+                                                 'handshake, skipping seeded bars and reconnecting after a dropped '
+                                                 'connection. Run from the repo root with '
+                                                 'python -m alpaca_strategies.check_bar_stream. Exits 1 on failure.')
+    parser.add_argument('--minutes', type=int, default=60, help='Bar size of the stream.')
+    parser.add_argument('--days', type=int, default=2, help='Days of minute bars to replay.')
+    parser.add_argument('--drop_after', type=int, default=None, help='Minutes replayed before the drop. Defaults to half.')
+    args = parser.parse_args()
+
+    failures = asyncio.run(check_stream(args.minutes, args.days, drop_after=args.drop_after))
+    for failure in failures:
+        print(f'FAIL {failure}')
+    print('The bar stream works.' if not failures else f'{len(failures)} checks failed.')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,244 @@
+# Standard imports:
+from logger import logging
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+# Third party imports:
+from alpaca.data import CryptoHistoricalDataClient
+from alpaca.data.requests import CryptoBarsRequest
+from alpaca.trading.stream import TradingStream
+from alpaca.trading.requests import LimitOrderRequest
+from alpaca.trading.enums import OrderSide, TimeInForce
+
+# Local imports:
+from backtesting.indicators import warm_up
+from alpaca_strategies.AlpacaBotv2 import AlpacaBot, LIVE
+from alpaca_strategies.bar_stream import BarStream, BarBuffer, STREAM_URL
+from backtesting.bar_sources import agg_minutes
+from alpaca_strategies.alpaca_keys import alpaca_live_keyid, alpaca_live_secret
+from alpaca_strategies.alpaca_keys import alpaca_paper_keyid, alpaca_paper_secret
+from live_trading.order_tracker import OrderTracker, alpaca_order_state
+from live_trading.account_state import AccountState, alpaca_balances
+from live_trading.runtime import BotRuntime
+from helper_functions import round_down
+
+# Constants:
+BATCH_SIZE = 100  # Symbols per CryptoBarsRequest
+
+
+class SymbolState:
+
+    '''Everything the supervisor keeps per symbol/strategy pair. Bars live in a small BarBuffer.'''
+
+    __slots__ = ['symbol', 'trade_symbol', 'strategy', 'indicators', 'bars', 'position_qty', 'handle']
+
+    def __init__(self, symbol:str, strategy, indicators:dict=None, capacity:int=200):
+        self.symbol = symbol
+        self.trade_symbol = symbol.replace('/', '')
+        self.strategy = strategy
+        self.indicators = indicators or dict()
+        self.bars = BarBuffer(capacity)
+        self.position_qty = 0.0
+        self.handle = None  # OrderHandle of the order in flight, if any
+
+    @property
+    def open_position(self):
+        return self.position_qty > 0
+
+    @property
+    def current_price(self):
+        return self.bars.last_close
+
+
+class Supervisor:
+
+    '''
+    Runs many symbol/strategy pairs in one process with one trading client, one market data client and one
+    order tracker.
+
+    At every candle close the new bars of all symbols are requested together, BATCH_SIZE symbols per
+    CryptoBarsRequest with the batches in parallel, and balances come from a cached AccountState. Then every
+    strategy(state) is called with its SymbolState and returns 'buy', 'sell' or 'pass'. All the sells are placed
+    and followed concurrently, then all the buys, each spending position_fraction of the cash the sells left.
+
+        supervisor = Supervisor(TimeFrame.Hour)
+        for symbol in symbols:
+            supervisor.add(symbol, strategy, indicators=dict(macd=MACD()))
+        supervisor.run_forever()
+    '''
+
+    def __init__(self, timeframe, position_fraction:float=None, capacity:int=200, seconds_toCancel:int=30, workers:int=16):
+        self.timeframe = timeframe
+        self.minutes = agg_minutes(timeframe)
+        self.position_fraction = position_fraction
+        self.capacity = capacity
+        self.seconds_toCancel = seconds_toCancel
+        self.states = dict()
+        self.cash_on_hand = 0.0
+        self.runtime = BotRuntime(workers)
+
+        # Shared clients. Their HTTP sessions pool connections across every symbol:
+        self.crypto_data_client = CryptoHistoricalDataClient()
+        self.trading_client = AlpacaBot.connect_account()
+        self.orders = OrderTracker(lambda order_id: alpaca_order_state(self.trading_client.get_order_by_id(order_id)),
+                                   self.trading_client.cancel_order_by_id)
+        self.trade_updates = None
+        self.account = AccountState(lambda: alpaca_balances(self.trading_client), self.orders)
+        self.account.reconcile(force=True)
+
+    def add(self, symbol:str, strategy, indicators:dict=None):
+        self.states[symbol] = SymbolState(symbol, strategy, indicators, self.capacity)
+        return self.states[symbol]
+
+    def _fetch_batch(self, symbols, start):
+        request_params = CryptoBarsRequest(symbol_or_symbols=symbols, timeframe=self.timeframe, start=start)
+        bars = self.crypto_data_client.get_crypto_bars(request_params, feed='us').df
+        if not len(bars):
+            return dict()
+        return {symbol: df.droplevel(0).tz_localize(None) for symbol, df in bars.groupby(level=0)}
+
+    async def fetch_bars(self, start):
+
+        '''Bars of every symbol since start, as {symbol: DataFrame}, from parallel batched requests.'''
+
+        symbols = list(self.states)
+        batches = [symbols[i:i + BATCH_SIZE] for i in range(0, len(symbols), BATCH_SIZE)]
+        frames = dict()
+        for result in await asyncio.gather(*[self.runtime.call(self._fetch_batch, batch, start) for batch in batches]):
+            frames.update(result)
+        return frames
+
+    async def update_bars(self, start=None):
+
+        '''Appends the new closed bars of every symbol to its buffer and indicators. Returns the updated symbols.'''
+
+        now = datetime.utcnow()
+        if start is None:
+            times = [state.bars.last_time for state in self.states.values() if len(state.bars)]
+            start = min(times) if len(times) == len(self.states) else now - timedelta(minutes=self.minutes * self.capacity)
+        updated = []
+        for symbol, df in (await self.fetch_bars(start)).items():
+            state = self.states[symbol]
+            df = df[df.index + timedelta(minutes=self.minutes) <= now]  # Closed bars only
+            if len(state.bars):
+                df = df[df.index > state.bars.last_time]
+            if len(df):
+                state.bars.extend(df)
+                warm_up(state.indicators, df)
+                updated.append(symbol)
+        return updated
+
+    def update_account(self):
+
+        '''Cash and every position from the account state, kept current by the order fills. No API call is made.'''
+
+        self.cash_on_hand = self.account.cash
+        for state in self.states.values():
+            state.position_qty = self.account.position(state.trade_symbol)
+
+    async def _buy(self, state:SymbolState, notional:float):
+        qty = float(round_down(notional / state.current_price, 3))
+        if qty <= 0:
+            return
+        order_data = LimitOrderRequest(symbol=state.trade_symbol, limit_price=state.current_price, qty=qty,
+                                       side=OrderSide.BUY, time_in_force=TimeInForce.GTC)
+        order = await self.runtime.call(self.trading_client.submit_order, order_data=order_data)
+        logging.info(f'{state.symbol}: placed order for {qty} shares at ${state.current_price}...')
+        state.handle = self.orders.track(order.id, timeout=self.seconds_toCancel, symbol=state.trade_symbol, side='buy')
+
+    async def _sell(self, state:SymbolState):
+        order = await self.runtime.call(self.trading_client.close_position, state.trade_symbol)
+        logging.info(f'{state.symbol}: closing {state.position_qty} shares...')
+        state.handle = self.orders.track(order.id, timeout=self.seconds_toCancel, symbol=state.trade_symbol, side='sell')
+
+    async def _wait(self, state:SymbolState):
+        try:
+            return await asyncio.wait_for(asyncio.shield(state.handle), 2 * self.seconds_toCancel)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _place(self, orders):
+
+        '''Submits (state, order coroutine) pairs concurrently, logging the ones that fail.'''
+
+        for (state, _), error in zip(orders, await asyncio.gather(*[order for _, order in orders], return_exceptions=True)):
+            if isinstance(error, Exception):
+                logging.error(f'{state.symbol}: order failed: {error}')
+
+    async def _follow(self, states):
+
+        '''
+        Waits for the orders of the states at once. Their fills reach the account state as they come. Orders
+        still open after twice the cancel timeout, e.g. when the broker can't be reached to cancel them, are
+        left to the tracker.
+        '''
+
+        states = [state for state in states if state.handle is not None]
+        for state, result in zip(states, await asyncio.gather(*[self._wait(state) for state in states])):
+            if result is None:
+                logging.warning(f'{state.symbol}: order {state.handle.order_id} is still open. Skipping the symbol until it finishes.')
+            else:
+                logging.info(f"{state.symbol}: order {result['status']}, {result['filled_qty']} shares filled.")
+
+    def listen_trade_updates(self):
+
+        '''One trade_updates websocket for the orders of every symbol, feeding the order tracker.'''
+
+        key, secret = (alpaca_live_keyid, alpaca_live_secret) if LIVE else (alpaca_paper_keyid, alpaca_paper_secret)
+        stream = TradingStream(key, secret, paper=not LIVE)
+        stream.subscribe_trade_updates(self.orders.alpaca_trade_updates)
+        threading.Thread(target=stream.run, name='trade-updates', daemon=True).start()
+        return stream
+
+    async def step(self):
+
+        '''One candle close: update bars and account, run every strategy, then place and follow its sells and its buys.'''
+
+        if self.trade_updates is None:
+            self.trade_updates = self.listen_trade_updates()
+        await self.update_bars()
+        self.update_account()
+
+        actions = dict()
+        for symbol, state in self.states.items():
+            if state.handle is not None and not state.handle.done():
+                continue  # Its last order is still in flight
+            state.handle = None
+            if not len(state.bars):
+                continue
+            try:
+                actions[symbol] = state.strategy(state)
+            except Exception:
+                logging.exception(f'{symbol}: strategy failed.')
+
+        # Sells first, so the buys are sized from the cash and positions they leave:
+        sells = [self.states[symbol] for symbol, action in actions.items() if action == 'sell' and self.states[symbol].open_position]
+        await self._place([(state, self._sell(state)) for state in sells])
+        await self._follow(sells)
+        self.update_account()
+
+        buys = [self.states[symbol] for symbol, action in actions.items() if action == 'buy' and not self.states[symbol].open_position]
+        fraction = self.position_fraction or 1 / max(len(self.states) - sum(s.open_position for s in self.states.values()), 1)
+        notional = self.cash_on_hand * fraction
+        await self._place([(state, self._buy(state, notional)) for state in buys])
+        await self._follow(buys)
+        self.update_account()
+        logging.info(f'Step complete: {len(buys)} buys, {len(sells)} sells across {len(self.states)} symbols.')
+
+    def stream(self, url=STREAM_URL):
+
+        '''
+        One BarStream for every symbol, sharing the supervisor's buffers: a single websocket instead of a
+        request per bar, e.g. to drive strategies from on_bar handlers between candle closes.
+        '''
+
+        key, secret = (alpaca_live_keyid, alpaca_live_secret) if LIVE else (alpaca_paper_keyid, alpaca_paper_secret)
+        stream = BarStream(list(self.states), self.timeframe, key, secret, url=url)
+        stream.buffers = {symbol: state.bars for symbol, state in self.states.items()}
+        return stream
+
+    def run_forever(self, run_now:bool=True):
+        self.runtime.every_bar(self.minutes, self.step, run_now=run_now)
+        self.account.schedule(self.runtime)
+        self.runtime.run_forever()
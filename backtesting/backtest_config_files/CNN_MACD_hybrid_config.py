@@ -11,19 +11,23 @@ strategy_config = dict(name='CNN_MACD_hybrid',
                        periods_needed=26,
                        )
 
-from tensorflow.keras.models import load_model
-import numpy as np
-model = load_model('../NN_research/1d_7period_cnn.h5')
+from indicators import window_features
+from prediction_cache import load_model
 
-def normalized_df(X):
-    return np.array([x/x[0]-1 for x in X])
+# The model is only loaded if its predictions are not in the backtester's prediction cache:
+MODEL_PATH = '../NN_Research/1d_7period_cnn.h5'
+feature_spec = dict(columns=['close', 'open', 'high', 'low', 'volume', 'trades'], window=21, normalize=True)
 
-def strategy(hist_data, position_flag, trade):
+def features(df):
+    return window_features(df, **feature_spec)
 
-    # CNN Prediction:
-    current_seq = np.array(hist_data.tail(21)[['close', 'open', 'high', 'low', 'volume', 'trades']])
-    normalized_seq = normalized_df(current_seq.reshape(1, 21, 6))
-    pred = model.predict(normalized_seq)[0][0]
+def predict(features):
+    return load_model(MODEL_PATH).predict(features, batch_size=1024)[:, 0]
+
+def strategy(hist_data, position_flag, trade, indicators):
+
+    # CNN Prediction, computed for every bar up front by the backtester:
+    pred = indicators['prediction'].value
 
     # MACD calculation:
     FAST, SLOW, SIGNAL = 12, 26, 9
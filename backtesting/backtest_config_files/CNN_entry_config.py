@@ -11,13 +11,21 @@ strategy_config = dict(name='CNN_entry_6prdexit',
                        periods_needed=42,
                        )
 
-from tensorflow.keras.models import load_model
-import numpy as np
-model = load_model('../NN_research/4h_6period_cnn.h5')
+from indicators import window_features
+from prediction_cache import load_model
 
-def strategy(hist_data, position_flag, trade):
-    current_seq = np.array(hist_data.tail(42)[['close', 'open', 'high', 'low', 'volume', 'trades']])
-    pred = model.predict(current_seq.reshape(1, 42, 6))[0][0]
+# The model is only loaded if its predictions are not in the backtester's prediction cache:
+MODEL_PATH = '../NN_Research/4h_6period_cnn.h5'
+feature_spec = dict(columns=['close', 'open', 'high', 'low', 'volume', 'trades'], window=42)
+
+def features(df):
+    return window_features(df, **feature_spec)
+
+def predict(features):
+    return load_model(MODEL_PATH).predict(features, batch_size=1024)[:, 0]
+
+def strategy(hist_data, position_flag, trade, indicators):
+    pred = indicators['prediction'].value
 
     if position_flag:
         if trade.period_count == 5:
@@ -11,17 +11,21 @@ strategy_config = dict(name='CNN_entry_1d_7period',
                        periods_needed=21,
                        )
 
-from tensorflow.keras.models import load_model
-import numpy as np
-model = load_model('../NN_research/1d_7period_cnn.h5')
+from indicators import window_features
+from prediction_cache import load_model
 
-def normalized_df(X):
-    return np.array([x/x[0]-1 for x in X])
+# The model is only loaded if its predictions are not in the backtester's prediction cache:
+MODEL_PATH = '../NN_Research/1d_7period_cnn.h5'
+feature_spec = dict(columns=['close', 'open', 'high', 'low', 'volume', 'trades'], window=21, normalize=True)
 
-def strategy(hist_data, position_flag, trade):
-    current_seq = np.array(hist_data.tail(21)[['close', 'open', 'high', 'low', 'volume', 'trades']])
-    normalized_seq = normalized_df(current_seq.reshape(1, 21, 6))
-    pred = model.predict(normalized_seq)[0][0]
+def features(df):
+    return window_features(df, **feature_spec)
+
+def predict(features):
+    return load_model(MODEL_PATH).predict(features, batch_size=1024)[:, 0]
+
+def strategy(hist_data, position_flag, trade, indicators):
+    pred = indicators['prediction'].value
 
     if position_flag:
         if trade.period_count == 6:
@@ -1,4 +1,6 @@
 from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
+import numpy as np
+from indicators import windowed_macd
 
 strategy_config = dict(name='MACD_03stoploss',
                        fiat_sym='USD',
@@ -13,10 +15,13 @@ strategy_config = dict(name='MACD_03stoploss',
                        periods_needed=26,
                        )
 
+# Strategy parameters, overridden by backtester.py --sweep:
+params = dict(FAST=12, SLOW=26, SIGNAL=9)
+
 def strategy(hist_data, position_flag, trade):
 
     # MACD calculation:
-    FAST, SLOW, SIGNAL = 12, 26, 9
+    FAST, SLOW, SIGNAL = params['FAST'], params['SLOW'], params['SIGNAL']
     exp1 = hist_data['close'].ewm(span=FAST, adjust=False).mean()
     exp2 = hist_data['close'].ewm(span=SLOW, adjust=False).mean()
     macd = exp1-exp2
@@ -32,4 +37,13 @@ def strategy(hist_data, position_flag, trade):
     elif macd_current > signal_current:
             return 'buy'
     else:
-        return 'pass'
\ No newline at end of file
+        return 'pass'
+
+def signals(df):
+
+    # MACD of every trailing window at once:
+    FAST, SLOW, SIGNAL = params['FAST'], params['SLOW'], params['SIGNAL']
+    macd, signal = windowed_macd(df['close'], FAST, SLOW, SIGNAL, window=strategy_config['periods_needed'])
+
+    # Action:
+    return np.where(macd > signal, 'buy', np.where(macd <= signal, 'sell', 'pass'))
\ No newline at end of file
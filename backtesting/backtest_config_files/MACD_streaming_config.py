@@ -0,0 +1,37 @@
+from indicators import MACD
+
+strategy_config = dict(name='MACD_streaming',
+                       fiat_sym='USD',
+                       crypto_sym='ETH',
+                       starting_capital=1000,
+                       agg=240,  # 4 hours
+                       start='2022-01-01',
+                       end='2022-06-30',
+                       stop_loss=0.1,
+                       take_profit=0.05,
+                       time_zone='US/Central',
+                       periods_needed=26,
+                       array_mode=True,
+                       )
+
+# Strategy parameters, overridden by backtester.py --sweep:
+params = dict(FAST=12, SLOW=26, SIGNAL=9)
+
+def indicators():
+    return dict(macd=MACD(fast=params['FAST'], slow=params['SLOW'], signal=params['SIGNAL']))
+
+def strategy(hist_data, position_flag, trade, indicators):
+
+    # MACD kept up to date by the backtester, one bar at a time:
+    macd_current, signal_current = indicators['macd'].value, indicators['macd'].signal
+
+    # Action:
+    if position_flag:
+        if macd_current <= signal_current:
+            return 'sell'
+        else:
+            return 'pass'
+    elif macd_current > signal_current:
+        return 'buy'
+    else:
+        return 'pass'
\ No newline at end of file
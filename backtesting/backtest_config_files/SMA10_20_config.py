@@ -11,10 +11,15 @@ strategy_config = dict(name='SMA_10_20',
                        periods_needed=50,
                        )
 
-def strategy(hist_data, position_flag):
+# Strategy parameters, overridden by backtester.py --sweep:
+params = dict(FAST=10, SLOW=20)
+
+import numpy as np
+
+def strategy(hist_data, position_flag, trade=None):
 
     # MACD calculation:
-    FAST, SLOW = 10, 20
+    FAST, SLOW = params['FAST'], params['SLOW']
     fast = hist_data['close'].rolling(window=FAST).mean()
     slow = hist_data['close'].rolling(window=SLOW).mean()
     fast_current, slow_current = fast[-1], slow[-1]
@@ -28,4 +33,16 @@ def strategy(hist_data, position_flag):
     elif fast_current > slow_current:
         return 'buy'
     else:
-        return 'pass'
\ No newline at end of file
+        return 'pass'
+
+def signals(df):
+
+    # Moving averages of every bar at once. strategy() only sees periods_needed bars, so it never gets
+    # an average longer than that:
+    FAST, SLOW = params['FAST'], params['SLOW']
+    window = strategy_config['periods_needed']
+    fast = df['close'].rolling(window=FAST).mean().to_numpy() if FAST <= window else np.full(len(df), np.nan)
+    slow = df['close'].rolling(window=SLOW).mean().to_numpy() if SLOW <= window else np.full(len(df), np.nan)
+
+    # Action:
+    return np.where(fast > slow, 'buy', np.where(fast <= slow, 'sell', 'pass'))
\ No newline at end of file
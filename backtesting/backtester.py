@@ -2,33 +2,93 @@
 import sys
 import argparse
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 import os
 from importlib import import_module
 
 # Third party imports:
+# matplotlib, seaborn, yfinance and the alpaca SDK are imported inside the methods that use them, so
+# runs without a report or without Alpaca data (and sweep workers) don't pay for them at startup.
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import yfinance as yf
-import seaborn as sns
-from alpaca.data import CryptoHistoricalDataClient
-from alpaca.data.requests import CryptoBarsRequest
-from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
 import warnings
 warnings.filterwarnings('ignore')
 
 # Local application imports:
-
-# Constants:
+from bar_store import BarStore
+from bar_sources import SOURCES, make_source
+from fills import FillModel
+from drilldown import DrillDown
+from reports import REPORT_FORMATS, report_payload, render_trades_plot, render_comparison_chart, write_report
+from metrics import backtest_metrics
+from indicators import Precomputed
+from prediction_cache import PredictionCache
 
 
 class CryptoStrategy:
 
-    """A class that holds the strategy function"""
+    """A class that holds the strategy function and, optionally, a vectorized signals function"""
 
-    def __init__(self, strategy_name:str, action_func):
+    def __init__(self, strategy_name:str, action_func, signals_func=None, array_mode=False, indicators_func=None,
+                 features_func=None, predict_func=None, model_path=None, feature_spec=None):
         self.name = strategy_name
         self.action_func = action_func
+        self.signals_func = signals_func
+        self.array_mode = array_mode
+        self.indicators_func = indicators_func
+        self.features_func = features_func
+        self.predict_func = predict_func
+        self.model_path = model_path
+        self.feature_spec = feature_spec
+
+
+def _window_column(col):
+    return property(lambda self: self._views[col][self._i], doc=f"Read-only view of the window's {col} column.")
+
+
+class BarWindow:
+
+    '''
+    The trailing bars handed to a strategy in array mode.
+
+    Every column is a read-only NumPy view into one sliding_window_view built up front, so moving to the
+    next bar only stores the new position and columns are looked up when the strategy reads them. The same
+    object is reused for every bar: copy anything the strategy wants to keep. Columns can be read as
+    window.close or window['close']; timestamp is the numpy.datetime64 of the current (last) bar.
+    '''
+
+    columns = ('open', 'high', 'low', 'close', 'volume', 'trades')
+    __slots__ = ('_views', '_timestamps', '_periods', '_i')
+
+    open = _window_column('open')
+    high = _window_column('high')
+    low = _window_column('low')
+    close = _window_column('close')
+    volume = _window_column('volume')
+    trades = _window_column('trades')
+
+    def __init__(self, df, periods:int):
+        self._periods = periods
+        self._timestamps = df.index.values
+        self._views = {col: np.lib.stride_tricks.sliding_window_view(df[col].to_numpy(dtype='float64'), periods)
+                       for col in self.columns if col in df.columns}
+        self._i = 0
+
+    def __getitem__(self, col):
+        return self._views[col][self._i]
+
+    def __len__(self):
+        return self._periods
+
+    @property
+    def timestamp(self):
+        return self._timestamps[self._i + self._periods - 1]
+
+    def move_to(self, i:int):
+
+        '''Point the window at bars i to i + periods - 1.'''
+
+        self._i = i
+        return self
 
 
 class Trade:
@@ -117,7 +177,16 @@ class BackcastStrategy:
         self.periods_needed = None
         self.stop_loss = None
         self.take_profit = None
+        self.fill_model = None
+        self.drilldown_agg = None
+        self.drilldown = None
+        self.curves = dict()
+        self.benchmarks = ['SPY']
+        self.source = 'alpaca'
+        self.source_options = dict()
         self.trades = dict()
+        self.bar_store = BarStore('bar_store')
+        self.prediction_cache = PredictionCache('prediction_cache')
         self.datestamp = datetime.now().strftime('%Y-%m-%d_%H%M')
 
     def set_parameters(self, starting_capital:int, crypto_sym:str, fiat_sym:str, data_agg:int, start_dt:str, end_dt:str, min_periods_needed:int, stop_loss:float, take_profit:float):
@@ -130,6 +199,8 @@ class BackcastStrategy:
         self.start = start_dt
         self.end = end_dt
         self.backcast_data = None
+        self.predictions = None
+        self.drilldown = None
         self.periods_needed = min_periods_needed
         self.stop_loss = stop_loss if stop_loss else None
         self.take_profit = take_profit if take_profit else None
@@ -141,107 +212,108 @@ class BackcastStrategy:
 
         return datetime.strptime(dt, '%Y-%m-%d').timestamp()
 
-    def next_smallest_agg(self, agg, current_min_intervals):
+    def load_data(self, use_bar_store=True):
 
-        for i, interval in enumerate(current_min_intervals):
-            if interval < agg:
-                continue
-            else:
-                return current_min_intervals[i-1]
+        '''
+        Loads the backcast bars from the config's source: alpaca (default), kraken, csv, store (the local bar
+        store only) or synthetic. Remote sources go through the bar store unless use_bar_store is False.
+        '''
 
-    def _get_backcast_data(self):
+        source = make_source(self.source, self.bar_store, use_bar_store, self.source_options)
+        self.backcast_data = source.fetch(f'{self.cryto_sym}/{self.fiat_sym}', self.agg, self.start, self.end)
+        if not self.end and len(self.backcast_data):
+            self.end = self.backcast_data.index[-1].date().strftime('%Y-%m-%d')
+        return self.backcast_data
 
-        current_min_intervals = [1, 5, 15, 60, 720, 1440]
-
-        # Load parameters
-        pair = self.cryto_sym + self.fiat_sym
-        if self.agg in current_min_intervals:
-            data_build_flag = False
-            query_agg = self.agg
-        else:
-            data_build_flag = True
-            query_agg = self.next_smallest_agg(self.agg, current_min_intervals)
-            print(f"{self.agg} is not a currently offered interval. Loading the {query_agg} intervals instead and building up to {self.agg}.")
-
-        # Load dataset
-        df = pd.read_csv(f"backcast_csv_data/{pair}_{query_agg}.csv", names=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trades'])
-        df.index = pd.to_datetime(df['timestamp'], unit='s')
-
-        # Convert to correct interval:
-        if data_build_flag:
-            df = df.resample(f'{self.agg}T').agg({
-                'open': 'first',
-                'high': 'max',
-                'low': 'min',
-                'close': 'last',
-                'volume': 'sum',
-                'trades': 'sum'
-            })
-            df = df.ffill() # forward fill early NaN's
-
-        # Filter based on start and end time:
-        if self.end:
-            df = df.loc[self.start:self.end]
-        else:
-            df = df.loc[self.start:]
-            self.end = df.index[-1].date().strftime('%Y-%m-%d')
+    def run_backcast(self, vectorized=True, use_bar_store=True):
 
-        return df
+        print(f'Running backcast. Staring with ${self.capital}')
 
-    def _get_backcast_dataAlpaca(self):
+        if self.backcast_data is None:
+            self.load_data(use_bar_store)
 
-        crypto_data_client = CryptoHistoricalDataClient()
+        if self.drilldown_agg and self.drilldown is None:
+            self.drilldown = DrillDown.from_local_data(self.cryto_sym + self.fiat_sym, self.drilldown_agg,
+                                                       self.backcast_data.index)
 
-        start = datetime.strptime(self.start, '%Y-%m-%d') if self.start else datetime.today() - relativedelta(months=+6)
-        end = datetime.strptime(self.end, '%Y-%m-%d') if self.end else None
+        self._init_curves()
+        if self.fill_model:
+            self.fill_model.drilldown = self.drilldown
+            trades_dict = self._run_fills()
+        elif vectorized and self.strategy.signals_func:
+            trades_dict = self._run_vectorized()
+        else:
+            trades_dict = self._run_per_bar()
+        self._finish_curves()
 
-        request_params = CryptoBarsRequest(
-            symbol_or_symbols=[f'{self.cryto_sym}/{self.fiat_sym}'],
-            timeframe=TimeFrame(4, TimeFrameUnit.Hour),
-            start=start,
-            end=end)
+        self.trades = pd.DataFrame.from_dict(trades_dict, orient='index').reset_index(drop=True)
 
-        bars = crypto_data_client.get_crypto_bars(request_params).df
-        bars.index = bars.index.map(lambda x: x[1])  # index returned as tuple. Replace with just the datetime
-        bars.index = [x.tz_localize(None) for x in bars.index]
-        return bars
+    def _run_per_bar(self):
 
-    def run_backcast(self):
+        '''
+        Calls the strategy once per bar with the trailing periods_needed bars. By default that is a DataFrame
+        slice; in array mode it is a BarWindow of read-only NumPy views, so no DataFrame is built per bar.
 
-        print(f'Running backcast. Staring with ${self.capital}')
+        If the config declares indicators(), the streaming indicators it returns are fed every bar from the
+        start of the data and passed to the strategy as a fourth argument. If it declares features() and
+        predict(), the model predictions for every bar are computed up front and served the same way, as
+        indicators['prediction'].
+        '''
 
         position_amount = 0
         position_flag = False
         trades_dict = dict()
         trade = None
 
-        # self.backcast_data = self._get_backcast_data()
-        self.backcast_data = self._get_backcast_dataAlpaca()
+        # Column arrays for the engine's own lookups:
+        close = self.backcast_data['close'].to_numpy(dtype='float64')
+        low = self.backcast_data['low'].to_numpy(dtype='float64')
+        timestamps = self.backcast_data.index
+        windows = BarWindow(self.backcast_data, self.periods_needed) if self.strategy.array_mode else None
+
+        # Streaming indicators, warmed up on the bars before the first window closes:
+        indicators = self.strategy.indicators_func() if self.strategy.indicators_func else dict()
+        if self.strategy.predict_func:
+            indicators['prediction'] = Precomputed(self.precompute_predictions())
+        if indicators:
+            bars = list(zip(*[self.backcast_data[col].to_numpy(dtype='float64') if col in self.backcast_data.columns
+                              else np.zeros(len(close)) for col in ['open', 'high', 'low', 'close', 'volume']]))
+            for bar in bars[:self.periods_needed - 1]:
+                for indicator in indicators.values():
+                    indicator.update_bar(*bar)
 
         for i in range(len(self.backcast_data) - self.periods_needed):
-            df_sliced = self.backcast_data[i:self.periods_needed + i]
-            current_price = df_sliced['close'][-1]
-            action = self.strategy.action_func(df_sliced, position_flag, trade)
+            bar = self.periods_needed + i - 1
+            hist_data = windows.move_to(i) if windows else self.backcast_data[i:self.periods_needed + i]
+            current_price = close[bar]
+            if indicators:
+                for indicator in indicators.values():
+                    indicator.update_bar(*bars[bar])
+                action = self.strategy.action_func(hist_data, position_flag, trade, indicators)
+            else:
+                action = self.strategy.action_func(hist_data, position_flag, trade)
             if position_flag and self.stop_loss:
-                if trade.stop_loss_flag(df_sliced['low'][-1]):
+                if trade.stop_loss_flag(low[bar]) and not self._take_profit_first(trade, bar, current_price):
                     self.capital = position_amount * trade.stop_loss_price
                     position_amount = 0
                     position_flag = False
-                    trades_dict[i] = trade.log_sell(df_sliced.index[-1], trade.stop_loss_price, self.capital, stop_loss=1)
+                    trades_dict[i] = trade.log_sell(timestamps[bar], trade.stop_loss_price, self.capital, stop_loss=1)
+                    self._record_bar(bar, position_amount, trade)
                     continue
             if position_flag and self.take_profit:
-                if trade.take_profit_flag(df_sliced['close'][-1]):
+                if trade.take_profit_flag(current_price):
                     self.capital = position_amount * trade.take_profit_price
                     position_amount = 0
                     position_flag = False
-                    trades_dict[i] = trade.log_sell(df_sliced.index[-1], trade.take_profit_price, self.capital, take_profit=1)
+                    trades_dict[i] = trade.log_sell(timestamps[bar], trade.take_profit_price, self.capital, take_profit=1)
+                    self._record_bar(bar, position_amount, trade)
                     continue
             if action == 'sell':
                 # Execute sell
                 self.capital = position_amount * current_price
                 position_amount = 0
                 position_flag = False
-                trades_dict[i] = trade.log_sell(df_sliced.index[-1], current_price, self.capital)
+                trades_dict[i] = trade.log_sell(timestamps[bar], current_price, self.capital)
                 trade = None
             elif action == 'buy':
                 # Execute buy:
@@ -249,24 +321,261 @@ class BackcastStrategy:
                 self.capital = 0
                 position_flag = True
                 trade = Trade(self.stop_loss, self.take_profit)
-                trade.log_buy(df_sliced.index[-1], current_price)
+                trade.log_buy(timestamps[bar], current_price)
             elif action == 'pass':
                 if position_flag:
                     trade.log_pass(current_price)
                 pass
+            self._record_bar(bar, position_amount, trade)
 
         # Close position at the end of the backcast:
         if position_flag:
             self.capital = position_amount * current_price
             position_amount = 0
             position_flag = False
-            trades_dict[i] = trade.log_sell(df_sliced.index[-1], current_price, self.capital)
+            trades_dict[i] = trade.log_sell(timestamps[bar], current_price, self.capital)
+            self._record_bar(bar, position_amount, trade)
+
+        return trades_dict
+
+    def _init_curves(self):
+
+        '''
+        Preallocates the per-bar curves, one float array per column, NaN outside the bars the backcast
+        evaluates. The engines record cash, position size and entry price; _finish_curves derives the rest.
+        '''
+
+        n = len(self.backcast_data)
+        first_bar, last_bar = self.periods_needed - 1, n - 2
+        self.curves = {col: np.full(n, np.nan) for col in ['capital', 'position', 'entry_price', 'equity', 'unrealized_pnl', 'drawdown']}
+        self.curves['capital'][first_bar:last_bar + 1] = self.capital
+        self.curves['position'][first_bar:last_bar + 1] = 0
+        self._flat_from = None  # Exit bar of the last trade _record_trade recorded
+
+    def _record_bar(self, bar:int, position_amount:float, trade):
+        self.curves['capital'][bar] = self.capital
+        self.curves['position'][bar] = position_amount
+        self.curves['entry_price'][bar] = trade.price_buy if position_amount else np.nan
+
+    def _record_trade(self, entry:int, exit_bar:int, position_amount:float, entry_price:float):
+
+        '''
+        Records a trade held from the close of entry to the close of exit_bar, and the capital after it.
+        The flat bars after an exit are filled when the next trade or _finish_curves is recorded, so every
+        bar is written once instead of once per trade.
+        '''
+
+        capital = self.curves['capital']
+        if self._flat_from is not None:
+            capital[self._flat_from + 1:entry] = capital[self._flat_from]
+        capital[entry:exit_bar] = 0
+        self.curves['position'][entry:exit_bar] = position_amount
+        self.curves['entry_price'][entry:exit_bar] = entry_price
+        capital[exit_bar] = self.capital
+        self._flat_from = exit_bar
+
+    def _finish_curves(self):
+
+        '''Equity, unrealized PnL and drawdown at every bar, marking positions to the close.'''
+
+        close = self.backcast_data['close'].to_numpy(dtype='float64')
+        curves = self.curves
+        if self._flat_from is not None:
+            curves['capital'][self._flat_from + 1:len(close) - 1] = curves['capital'][self._flat_from]
+        curves['equity'][:] = curves['capital'] + curves['position'] * close
+        held = curves['position'] > 0
+        curves['unrealized_pnl'][:] = curves['position'] * 0  # 0 when flat, NaN outside the evaluated bars
+        curves['unrealized_pnl'][held] = curves['position'][held] * (close[held] - curves['entry_price'][held])
+        curves['drawdown'][:] = curves['equity'] / np.fmax.accumulate(curves['equity']) - 1
+
+    def _take_profit_first(self, trade, bar:int, current_price:float):
+
+        '''
+        True if bar hit both the stop loss and the take profit and its finer bars show the take profit was
+        reached first. Without drilldown_agg the stop loss always wins.
+        '''
+
+        if not self.drilldown or not trade.take_profit_flag(current_price):
+            return False
+        return self.drilldown.first_touch(bar, trade.stop_loss_price, trade.take_profit_price) == 'take_profit'
+
+    def precompute_predictions(self):
+
+        '''
+        Builds the model features of every bar in one vectorized pass and runs a single batched predict.
+        Returns one prediction per bar, NaN for bars without a full feature window.
+
+        If the config declares MODEL_PATH and feature_spec, predictions are saved to the prediction cache and
+        reused by later runs over the same bars with the same model file and features.
+        '''
+
+        if self.predictions is not None:
+            return self.predictions
+
+        cache_key = None
+        if self.strategy.model_path and self.strategy.feature_spec is not None:
+            cache_key = self.prediction_cache.key(self.strategy.model_path, self.strategy.feature_spec,
+                                                  self.backcast_data.index)
+            self.predictions = self.prediction_cache.get(cache_key)
+            if self.predictions is not None:
+                return self.predictions
+
+        features = self.strategy.features_func(self.backcast_data)
+        predictions = np.full(len(self.backcast_data), np.nan)
+        predictions[len(self.backcast_data) - len(features):] = self.strategy.predict_func(features)
+        if cache_key:
+            self.prediction_cache.put(cache_key, predictions)
+        self.predictions = predictions
+        return self.predictions
+
+    def _run_vectorized(self):
+
+        '''
+        Runs a strategy that exposes signals(df) without calling it per bar.
+
+        signals(df) returns 'buy', 'sell' or 'pass' for every bar using only data up to that bar. A buy is
+        taken when flat and a sell when in a position, so the only Python loop is over trades: each trade
+        searches forward from its entry for the first stop loss, take profit or sell signal.
+        Produces the same trades as the per-bar path for a strategy whose action only depends on position_flag.
+        '''
+
+        df = self.backcast_data
+        signals = np.asarray(self.strategy.signals_func(df))
+        close = df['close'].to_numpy(dtype='float64')
+        low = df['low'].to_numpy(dtype='float64')
+        trades_dict = dict()
 
-        self.trades = pd.DataFrame.from_dict(trades_dict, orient='index').reset_index(drop=True)
+        # Bars the per-bar loop evaluates:
+        first_bar = self.periods_needed - 1
+        last_bar = len(df) - 2
+        if last_bar < first_bar:
+            return trades_dict
+        buy_bars = np.flatnonzero(signals[first_bar:last_bar + 1] == 'buy') + first_bar
+        sell_bars = np.flatnonzero(signals[first_bar:last_bar + 1] == 'sell') + first_bar
+
+        bar = first_bar
+        while True:
+            # Entry on the next buy signal:
+            k = np.searchsorted(buy_bars, bar)
+            if k == len(buy_bars):
+                break
+            entry = buy_bars[k]
+            position_amount = self.capital / close[entry]
+            self.capital = 0
+            trade = Trade(self.stop_loss, self.take_profit)
+            trade.log_buy(df.index[entry], close[entry])
+
+            # Exit on the next sell signal, unless a stop loss or take profit is hit first. On the same bar
+            # the stop loss is checked before the take profit, and both before the signal:
+            k = np.searchsorted(sell_bars, entry, side='right')
+            exits = [(sell_bars[k], 2, close[sell_bars[k]])] if k < len(sell_bars) else []
+            held = slice(entry + 1, (exits[0][0] if exits else last_bar) + 1)
+            if self.stop_loss:
+                hits = np.flatnonzero(low[held] <= trade.stop_loss_price)
+                if len(hits):
+                    exits.append((entry + 1 + hits[0], 0, trade.stop_loss_price))
+            if self.take_profit:
+                hits = np.flatnonzero(close[held] >= trade.take_profit_price)
+                if len(hits):
+                    exits.append((entry + 1 + hits[0], 1, trade.take_profit_price))
+            exit_bar, exit_type, exit_price = min(exits) if exits else (None, None, None)
+            if exit_type == 0 and self._take_profit_first(trade, exit_bar, close[exit_bar]):
+                exit_bar, exit_type, exit_price = exit_bar, 1, trade.take_profit_price
+
+            # Close position at the end of the backcast:
+            if exit_bar is None:
+                exit_bar, exit_price = last_bar, close[last_bar]
+                passed = close[entry + 1:last_bar + 1]
+            else:
+                passed = close[entry + 1:exit_bar]
+
+            # Same bookkeeping log_pass does for every bar held:
+            trade.period_count = len(passed)
+            if len(passed):
+                pct_change = (passed - trade.price_buy) / trade.price_buy
+                trade.highest_gain = max(trade.highest_gain, pct_change.max())
+                trade.max_drawdown = min(trade.max_drawdown, pct_change.min())
+
+            self.capital = position_amount * exit_price
+            self._record_trade(entry, exit_bar, position_amount, trade.price_buy)
+            trades_dict[exit_bar - first_bar] = trade.log_sell(df.index[exit_bar], exit_price, self.capital,
+                                                               stop_loss=int(exit_type == 0), take_profit=int(exit_type == 1))
+            bar = exit_bar + 1
+
+        return trades_dict
+
+    def _run_fills(self):
+
+        '''
+        Runs a signals(df) strategy through the fill model: entries and exits are filled as orders against
+        each bar's open, high, low and close, with fees and slippage. Like _run_vectorized, the only Python
+        loop is over trades. Trades also log the fees paid on both fills.
+        '''
+
+        if not self.strategy.signals_func:
+            raise ValueError('Fill simulation needs a config that defines signals(df).')
+        df = self.backcast_data
+        fills = self.fill_model.bind(df)
+        signals = np.asarray(self.strategy.signals_func(df))
+        close = fills.close
+        trades_dict = dict()
+
+        first_bar = self.periods_needed - 1
+        last_bar = len(df) - 2
+        if last_bar < first_bar:
+            return trades_dict
+        buy_bars = np.flatnonzero(signals[first_bar:last_bar + 1] == 'buy') + first_bar
+        sell_bars = np.flatnonzero(signals[first_bar:last_bar + 1] == 'sell') + first_bar
+
+        bar = first_bar
+        while True:
+            # Entry order on the next buy signal. A limit order that expires unfilled waits for the next one:
+            k = np.searchsorted(buy_bars, bar)
+            if k == len(buy_bars):
+                break
+            entry_fill = fills.entry(buy_bars[k], last_bar)
+            if entry_fill is None:
+                bar = buy_bars[k] + 1
+                continue
+            entry, entry_price = entry_fill
+            position_amount = self.capital / (entry_price * (1 + fills.fee))
+            fees = self.capital - position_amount * entry_price
+            self.capital = 0
+            trade = Trade(self.stop_loss, self.take_profit)
+            trade.log_buy(df.index[entry], entry_price)
+
+            # Exit on the first stop, take profit or sell signal after the entry bar:
+            k = np.searchsorted(sell_bars, entry, side='right')
+            exit_fill = fills.exit(entry, entry_price, sell_bars[k] if k < len(sell_bars) else None, last_bar)
+            if exit_fill is None:
+                # Close position at the end of the backcast:
+                exit_bar, exit_price, reason = last_bar, fills.close_out(last_bar), 'signal'
+                passed = close[entry + 1:last_bar + 1]
+            else:
+                exit_bar, exit_price, reason = exit_fill
+                passed = close[entry + 1:exit_bar]
+
+            trade.period_count = len(passed)
+            if len(passed):
+                pct_change = (passed - trade.price_buy) / trade.price_buy
+                trade.highest_gain = max(trade.highest_gain, pct_change.max())
+                trade.max_drawdown = min(trade.max_drawdown, pct_change.min())
+
+            proceeds = position_amount * exit_price
+            fees += proceeds * fills.fee
+            self.capital = proceeds * (1 - fills.fee)
+            self._record_trade(entry, exit_bar, position_amount, entry_price)
+            trades_dict[exit_bar - first_bar] = dict(trade.log_sell(df.index[exit_bar], exit_price, self.capital,
+                                                                    stop_loss=int(reason == 'stop'),
+                                                                    take_profit=int(reason == 'take_profit')),
+                                                     fees=fees)
+            bar = exit_bar + 1
+
+        return trades_dict
 
     def build_summary_report(self):
         df = self.trades
-        df['winning_trade'] = df['pct_change'].apply(lambda x: 1 if x > 0 else 0)
+        df['winning_trade'] = (df['pct_change'] > 0).astype(int)
         wins = df[df['winning_trade'] == 1]
         loss = df[df['winning_trade'] == 0]
         num_wins = len(wins)
@@ -278,6 +587,7 @@ class BackcastStrategy:
         loss_max = loss['pct_change'].min()
         abs_return = self.capital - self.starting_capital
         pct_return = (self.capital - self.starting_capital) / self.starting_capital
+        metrics = backtest_metrics(self)
 
         df = pd.DataFrame([
                             ['Starting Capital', f"${self.starting_capital}"],
@@ -294,109 +604,41 @@ class BackcastStrategy:
                             ['Backcast Range', f"{self.start} to {self.end}"],
                             ["Number of Candlesticks", f"{len(self.backcast_data)}"],
                             ["Number of Trades", f"{len(self.trades)}"],
-                            [f"Trade to Candlestick ratio", f"{len(self.trades)/len(self.backcast_data):.2}"]
+                            [f"Trade to Candlestick ratio", f"{len(self.trades)/len(self.backcast_data):.2}"],
+                            ['Annualized Return', f"{metrics['annual_return']:.2%}"],
+                            ['Sharpe Ratio', f"{metrics['sharpe']:.2f}"],
+                            ['Sortino Ratio', f"{metrics['sortino']:.2f}"],
+                            ['Calmar Ratio', f"{metrics['calmar']:.2f}"],
+                            ['Max Drawdown', f"{metrics['max_drawdown']:.2%}"],
+                            ['Max Drawdown Duration', f"{metrics['max_drawdown_duration']} candlesticks"],
+                            ['Exposure', f"{metrics['exposure']:.2%}"],
+                            ['Turnover', f"{metrics['turnover']:.1f}x per year"],
+                            ['Profit Factor', f"{metrics['profit_factor']:.2f}"]
             ])
 
         return df
 
     def build_trades_plot(self):
 
-        # Plot 1:
-        plt.style.use('seaborn-whitegrid')
-        plt.figure(figsize=(30, 8))
-        plt.plot(self.backcast_data.index, self.backcast_data['close'], lw=2)
-        plt.xticks([])
-        plt.scatter(self.trades['trade_start'], self.trades['buy_price'], marker='^', s=70, color='green')
-        plt.scatter(self.trades['trade_end'], self.trades['sell_price'], marker='v', s=70, color='red')
-        for i in range(len(self.trades)):
-            plt.annotate(i, (self.trades['trade_start'][i], self.trades['buy_price'][i]), xytext=(-10, -10),
-                         textcoords='offset points', fontsize=14, fontweight='bold')
-        for i in range(len(self.trades)):
-            plt.annotate(i, (self.trades['trade_end'][i], self.trades['sell_price'][i]), xytext=(-10, -10),
-                         textcoords='offset points', fontsize=14, fontweight='bold')
-        sns.despine()
-
-        # Save figure1:
-        fname = f"{self.strategy_name}_{self.datestamp}_trades"
-        filepath = f'backtest_summaries/{fname}.png'
-        plt.savefig(filepath)
-        return filepath
+        '''The trades plot as PNG bytes in a BytesIO buffer.'''
+
+        return render_trades_plot(report_payload(self))
 
     def build_comparison_chart(self):
 
-        df_trades = pd.DataFrame(self.trades)
-
-        # Current strategy dataset:
-        df_strategy = df_trades[['pct_change']]
-        df_strategy['date'] = [x.date() for x in df_trades['trade_end']]
-        df_strategy['abs_returns'] = ((1 + df_strategy['pct_change']).cumprod()) * self.starting_capital
-        df_strategy_grouped = df_strategy.groupby('date', as_index=False).tail(1)
-        df_strategy_grouped.rename(columns={'abs_returns': 'strategy'}, inplace=True)
-        df_strategy_grouped.set_index('date', inplace=True)
-        df_strategy = df_strategy_grouped[['strategy']]
-
-
-
-        # Buy and hold dataset:
-        pair = self.cryto_sym + self.fiat_sym
-        df_bh = self.backcast_data
-        # df_bh.index = pd.to_datetime(df_bh['timestamp'], unit='s')
-        # df_bh = df_bh.loc[self.start:self.end]
-        df_bh['pct_change'] = df_bh['close'].pct_change()
-        df_bh['abs_returns'] = ((1 + df_bh['pct_change']).cumprod()) * self.starting_capital
-        df_bh.rename(columns={'abs_returns': 'buy_and_hold'}, inplace=True)
-        df_bh = df_bh[['buy_and_hold']]
-
-        # S&P 500 Dataset:
-        df_spy = yf.download('SPY', start=self.start, end=self.end, progress=False)
-        df_spy['pct_change'] = df_spy[['Close']].pct_change()
-        df_spy['abs_returns'] = ((1 + df_spy['pct_change']).cumprod()) * self.starting_capital
-        df_spy.rename(columns={'abs_returns': 's&p500'}, inplace=True)
-        df_spy = df_spy[['s&p500']]
-
-        # Merge datasets and plot:
-        df_merge_temp = df_bh.merge(df_strategy, left_index=True, right_index=True, how='left')
-        df_merge = df_merge_temp.merge(df_spy, left_index=True, right_index=True, how='left')
-        df_merge.iloc[0] = self.starting_capital
-        df_merge.ffill(inplace=True)
-        plt.style.use('seaborn-whitegrid')
-        df_merge.plot(figsize=(30, 8))
-        fname = f"{self.strategy_name}_{self.datestamp}_compare"
-        filepath = f'backtest_summaries/{fname}.png'
-        plt.savefig(filepath)
-
-        return filepath
-
-    def build_backcast_report(self):
-
-        # Build the summary tab
-        fname = f"{self.strategy_name}_{self.datestamp}"
-        writer = pd.ExcelWriter(f"backtest_summaries/{fname}.xlsx", engine='xlsxwriter')
-        df_summary = self.build_summary_report()
-        df_summary.to_excel(writer, sheet_name='Backtest Summary', index=False, header=False)
-
-        # Build the trades tab:
-        df_trades = pd.DataFrame(self.trades)
-        df_trades['time_held'] = [str(x) for x in df_trades['time_held']]
-        df_trades.to_excel(writer, sheet_name='Trades')
-
-        # Build plots:
-        plot1_filepath = self.build_trades_plot()
-        plot_worksheet1 = writer.book.add_worksheet(name='Trades Plot')
-        plot_worksheet1.insert_image('C2', plot1_filepath)
-
-        plot2_filepath = self.build_comparison_chart()
-        plot_worksheet2 = writer.book.add_worksheet(name='Comparison Plot')
-        plot_worksheet2.insert_image('C2', plot2_filepath)
-
-        # Save the file:
-        writer.save()
-
-        # Delete files:
-        os.remove(plot1_filepath)
-        os.remove(plot2_filepath)
+        '''Strategy equity against buy and hold and the benchmarks, as PNG bytes in a BytesIO buffer.'''
 
-        return
+        return render_comparison_chart(report_payload(self))
+
+    def build_backcast_report(self, fmt='xlsx'):
+
+        '''
+        Writes the report to backtest_summaries/ and returns its path. fmt is 'xlsx' (summary, trades and
+        plots), or 'html' or 'json' for light reports of downsampled series. reports.ReportPool renders
+        them on background processes instead.
+        '''
+
+        return write_report(report_payload(self), fmt)
 
 
 def parse_args(args):
@@ -404,23 +646,72 @@ def parse_args(args):
 
     parser.add_argument('--strategy_config_file',
                         help='The path to the strategy configuration file. File should include strategy and settings.')
+    parser.add_argument('--per_bar', action='store_true',
+                        help='Call the per-bar strategy function even if the config file defines signals(df).')
+    parser.add_argument('--no_report', '--no-report', action='store_true',
+                        help='Skip building the Excel report and plots.')
+    parser.add_argument('--report_format', default='xlsx', choices=REPORT_FORMATS,
+                        help='Excel report with plots, or a light html/json report of downsampled series.')
+    parser.add_argument('--no_bar_store', action='store_true',
+                        help='Fetch the backcast data from Alpaca without reading or updating the local bar store.')
+    parser.add_argument('--source', choices=SOURCES,
+                        help='Where the bars come from. Defaults to the config\'s source, or alpaca.')
+
+    # Parameter sweeps (see sweep.py):
+    parser.add_argument('--sweep',
+                        help='JSON parameter space, e.g. \'{"FAST": [8, 12, 16], "stop_loss": [0.05, 0.1]}\'. '
+                             'Keys in the config\'s params dict set strategy parameters, other keys set strategy_config values. '
+                             'Values are listed for grid sweeps and [low, high] bounds for random and lhs sweeps.')
+    parser.add_argument('--sweep_method', default='grid', choices=['grid', 'random', 'lhs'],
+                        help='Run every combination, or sample randomly or by Latin hypercube.')
+    parser.add_argument('--samples', type=int, default=100, help='Number of samples for random and lhs sweeps.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for random and lhs sweeps.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. Defaults to all cores.')
+    parser.add_argument('--top_k', type=int, default=3, help='Build the full Excel report for the best k runs.')
+
+    # Portfolio backtests (see portfolio.py):
+    parser.add_argument('--symbols', help='Comma separated crypto symbols, e.g. ETH,BTC,SOL, to run as one portfolio.')
+    parser.add_argument('--allocation', choices=['equal_weight', 'fixed_fraction'],
+                        help='Capital per position. Defaults to the config\'s allocation, or equal_weight.')
+    parser.add_argument('--max_positions', type=int, help='Most positions open at once. Defaults to the number of symbols.')
+    parser.add_argument('--position_fraction', type=float, help='Fraction of equity per position for fixed_fraction.')
+
+    # Walk-forward validation (see walk_forward.py), searching the --sweep space on every train fold:
+    parser.add_argument('--walk_forward', action='store_true',
+                        help='Optimize on rolling train folds and evaluate on the test fold after each one.')
+    parser.add_argument('--train_bars', type=int, default=1000, help='Bars per train fold.')
+    parser.add_argument('--test_bars', type=int, default=250, help='Bars per test fold.')
+    parser.add_argument('--anchored', action='store_true', help='Train every fold from the first bar instead of a rolling window.')
+    parser.add_argument('--objective', default='pct_return',
+                        choices=['pct_return', 'sharpe', 'sortino', 'calmar', 'max_drawdown', 'profit_factor', 'win_ratio'],
+                        help='What the train folds maximize.')
 
     options = parser.parse_args(args)
     return options
 
 
-def run_backtest(params):
+def load_strategy_file(strategy_config_file:str):
+    if '.py' in strategy_config_file:
+        strategy_config_file = strategy_config_file.replace('.py', '')
+    return import_module(strategy_config_file)
+
+
+def build_backtest(strategy_file):
+
+    '''Builds a BackcastStrategy from a config module's strategy functions and strategy_config.'''
 
-    # Load strategy file:
-    args = parse_args(params)
-    if '.py' in args.strategy_config_file:
-        args.strategy_config_file = args.strategy_config_file.replace('.py', '')
-    strategy_file = import_module(args.strategy_config_file)
     func = strategy_file.strategy
+    signals_func = getattr(strategy_file, 'signals', None)
     config = strategy_file.strategy_config
 
     # Load backtest:
-    strategy = CryptoStrategy(strategy_name=config['name'], action_func=func)
+    strategy = CryptoStrategy(strategy_name=config['name'], action_func=func, signals_func=signals_func,
+                              array_mode=config.get('array_mode', False),
+                              indicators_func=getattr(strategy_file, 'indicators', None),
+                              features_func=getattr(strategy_file, 'features', None),
+                              predict_func=getattr(strategy_file, 'predict', None),
+                              model_path=getattr(strategy_file, 'MODEL_PATH', None),
+                              feature_spec=getattr(strategy_file, 'feature_spec', None))
     backtest = BackcastStrategy(strategy)
 
     # Load settings:
@@ -431,13 +722,45 @@ def run_backtest(params):
                             start_dt=config['start'],
                             end_dt=config['end'],
                             min_periods_needed=config['periods_needed'],
-                            stop_loss=config['stop_loss'],
-                            take_profit=config['take_profit'])
+                            stop_loss=config.get('stop_loss'),
+                            take_profit=config.get('take_profit'))
+    backtest.fill_model = FillModel.from_config(config)
+    backtest.drilldown_agg = config.get('drilldown_agg')
+    backtest.benchmarks = config.get('benchmarks', ['SPY'])
+    backtest.source = config.get('source', 'alpaca')
+    backtest.source_options = config.get('source_options', dict())
+    return backtest
+
+
+def run_backtest(params):
+
+    # Load strategy file:
+    args = parse_args(params)
+    if args.walk_forward:
+        from walk_forward import run_walk_forward
+        run_walk_forward(args)
+        return
+    if args.sweep:
+        from sweep import run_sweep
+        run_sweep(args)
+        return
+    if args.symbols:
+        from portfolio import run_portfolio
+        run_portfolio(args)
+        return
+    strategy_file = load_strategy_file(args.strategy_config_file)
+    if args.source:
+        strategy_file.strategy_config['source'] = args.source
+    backtest = build_backtest(strategy_file)
 
     # Run backtest and create report
-    backtest.run_backcast()
-    backtest.build_backcast_report()
-    print('Backtest Complete. Results saved to backtest_summaries/')
+    backtest.run_backcast(vectorized=not args.per_bar, use_bar_store=not args.no_bar_store)
+    if args.no_report:
+        print(backtest.build_summary_report().to_string(index=False, header=False))
+        print('Backtest Complete.')
+        return
+    path = backtest.build_backcast_report(args.report_format)
+    print(f'Backtest Complete. Results saved to {path}')
     return
 
 
@@ -0,0 +1,374 @@
+# Standard imports:
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Local application imports:
+try:
+    from bar_store import BarStore, MemmapBars
+except ModuleNotFoundError:  # Imported from the repo root, e.g. by the live bots for agg_minutes
+    from backtesting.bar_store import BarStore, MemmapBars
+
+# Constants:
+CSV_INTERVALS = [1, 5, 15, 60, 720, 1440]  # Minutes available in backcast_csv_data
+KRAKEN_INTERVALS = [1, 5, 15, 30, 60, 240, 1440, 10080, 21600]
+KRAKEN_MAX_BARS = 720  # Kraken's OHLC endpoint only keeps the most recent bars of each interval
+SOURCES = ['alpaca', 'kraken', 'csv', 'store', 'synthetic']
+
+
+def agg_minutes(agg):
+
+    '''Bar length in minutes of an agg given as minutes or as an alpaca TimeFrame.'''
+
+    if isinstance(agg, (int, np.integer)):
+        return int(agg)
+    unit_minutes = dict(Min=1, Hour=60, Day=1440, Week=10080)
+    amount, unit = getattr(agg, 'amount_value', None) or agg.amount, getattr(agg, 'unit_value', None) or agg.unit
+    return amount * unit_minutes[unit.value]
+
+
+def alpaca_timeframe(agg):
+
+    '''
+    An alpaca TimeFrame for an agg in minutes, in the largest whole unit. TimeFrames pass through.
+    Alpaca only serves 1-59 minutes, 1-23 hours, 1 day and 1 week, so other aggs raise a ValueError.
+    '''
+
+    from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
+
+    if not isinstance(agg, (int, np.integer)):
+        return agg
+    if agg == 10080:
+        return TimeFrame(1, TimeFrameUnit.Week)
+    if agg == 1440:
+        return TimeFrame(1, TimeFrameUnit.Day)
+    if agg % 60 == 0 and agg // 60 <= 23:
+        return TimeFrame(int(agg // 60), TimeFrameUnit.Hour)
+    if 1 <= agg <= 59:
+        return TimeFrame(int(agg), TimeFrameUnit.Minute)
+    raise ValueError(f'Alpaca has no {agg} minute bars. Use 1-59 minutes, whole hours up to 23, 1440 or 10080.')
+
+
+def _run(coroutine):
+
+    '''Runs a coroutine to completion from sync code, on a helper thread if an event loop is already running.'''
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(asyncio.run, coroutine).result()
+
+
+class BarSource:
+
+    '''
+    Where backcast bars come from. fetch(symbol, agg, start, end) returns an OHLCV DataFrame with a sorted,
+    tz-naive datetime index, for a symbol like 'ETH/USD' and an agg in minutes or as an alpaca TimeFrame.
+    start and end are dates or timestamps, either may be None.
+    '''
+
+    name = None
+
+    def fetch(self, symbol:str, agg, start=None, end=None):
+        raise NotImplementedError
+
+    def store_key(self, agg):
+
+        '''Timeframe part of this source's bar store key.'''
+
+        return f'{self.name}_{agg_minutes(agg)}'
+
+
+class RemoteSource(BarSource):
+
+    '''
+    A source behind a network API. The requested range is cut into pages of page_bars bars that are
+    fetched concurrently, by fetch_page on worker threads, with at most max_connections requests in flight.
+    '''
+
+    default_start = pd.DateOffset(months=6)  # When start is None
+
+    def __init__(self, page_bars:int=5000, max_connections:int=4):
+        self.page_bars = page_bars
+        self.max_connections = max_connections
+
+    def fetch_page(self, symbol:str, agg, start, end):
+        raise NotImplementedError
+
+    def first_start(self, agg, end):
+
+        '''Start of a request that has none.'''
+
+        return (end - self.default_start).normalize()
+
+    def pages(self, agg, start, end):
+        length = pd.Timedelta(minutes=agg_minutes(agg) * self.page_bars)
+        edges = list(pd.date_range(start, end, freq=length)) + [end]
+        return [(a, b) for a, b in zip(edges[:-1], edges[1:]) if a < b]
+
+    async def fetch_async(self, symbol:str, agg, start=None, end=None):
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz='UTC').tz_localize(None)
+        start = pd.Timestamp(start) if start is not None else self.first_start(agg, end)
+        connections = asyncio.Semaphore(self.max_connections)
+
+        async def page(page_start, page_end):
+            async with connections:
+                return await asyncio.to_thread(self.fetch_page, symbol, agg, page_start, page_end)
+
+        frames = await asyncio.gather(*[page(a, b) for a, b in self.pages(agg, start, end)])
+        frames = [df for df in frames if len(df)]
+        if not frames:
+            return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'], index=pd.DatetimeIndex([], name='timestamp'))
+        df = pd.concat(frames).sort_index()
+        return df[~df.index.duplicated(keep='last')]
+
+    def fetch(self, symbol:str, agg, start=None, end=None):
+        return _run(self.fetch_async(symbol, agg, start, end))
+
+
+class AlpacaSource(RemoteSource):
+
+    '''Crypto bars from Alpaca's historical data API, at the config's agg instead of a fixed 4 hours.'''
+
+    name = 'alpaca'
+
+    def __init__(self, page_bars:int=5000, max_connections:int=4):
+        super().__init__(page_bars, max_connections)
+        self._client = None
+
+    def store_key(self, agg):
+        return alpaca_timeframe(agg).value  # e.g. '4Hour', the key earlier bar store files were written under
+
+    def fetch_page(self, symbol:str, agg, start, end):
+        from alpaca.data import CryptoHistoricalDataClient
+        from alpaca.data.requests import CryptoBarsRequest
+
+        if self._client is None:
+            self._client = CryptoHistoricalDataClient()
+        request_params = CryptoBarsRequest(symbol_or_symbols=[symbol], timeframe=alpaca_timeframe(agg),
+                                           start=start.to_pydatetime(), end=end.to_pydatetime())
+        bars = self._client.get_crypto_bars(request_params).df
+        if not len(bars):
+            return bars
+        bars.index = bars.index.map(lambda x: x[1])  # index returned as tuple. Replace with just the datetime
+        bars.index = [x.tz_localize(None) for x in bars.index]
+        return bars[(bars.index >= start) & (bars.index < end)]
+
+
+class KrakenSource(RemoteSource):
+
+    '''
+    OHLC bars from Kraken's public API. Kraken answers with at most 720 bars from since onwards and only
+    keeps the most recent 720 of each interval, so older ranges raise a ValueError instead of coming back
+    empty; use CSV data for history.
+    '''
+
+    name = 'kraken'
+
+    def __init__(self, page_bars:int=KRAKEN_MAX_BARS, max_connections:int=2):
+        super().__init__(page_bars, max_connections)
+
+    def first_start(self, agg, end):
+        minutes = agg_minutes(agg)
+        return (end - pd.Timedelta(minutes=minutes * (KRAKEN_MAX_BARS - 1))).floor(f'{minutes}min')
+
+    def fetch_page(self, symbol:str, agg, start, end):
+        import krakenex
+        from pykrakenapi import KrakenAPI
+
+        interval = agg_minutes(agg)
+        if interval not in KRAKEN_INTERVALS:
+            raise ValueError(f'Kraken has no {interval} minute bars. Use one of {KRAKEN_INTERVALS}.')
+        oldest = self.first_start(interval, pd.Timestamp.now(tz='UTC').tz_localize(None))
+        if start < oldest:
+            raise ValueError(f'Kraken only keeps the latest {KRAKEN_MAX_BARS} {interval} minute bars, from {oldest}. '
+                             f'Use the csv source for bars from {start}.')
+        api = KrakenAPI(krakenex.API())
+        df, _ = api.get_ohlc_data(symbol.replace('/', ''), interval=interval, since=int(start.timestamp()), ascending=True)
+        df.index = pd.DatetimeIndex(df.index, name='timestamp').tz_localize(None)
+        df = df.rename(columns={'count': 'trades'})[['open', 'high', 'low', 'close', 'volume', 'trades']].astype('float64')
+        return df[(df.index >= start) & (df.index < end)]
+
+
+class CSVSource(BarSource):
+
+    '''
+    Kraken-style csv files in backcast_csv_data, or their memory-mapped copies in backcast_bin_data.
+
+    Intervals that have no file are built from the next smallest one. A csv is parsed once into the bar
+    store and only again when it changes.
+    '''
+
+    name = 'csv'
+
+    def __init__(self, bar_store:BarStore=None, csv_dir:str='backcast_csv_data', bin_dir:str='backcast_bin_data'):
+        self.bar_store = bar_store if bar_store is not None else BarStore('bar_store')
+        self.csv_dir = csv_dir
+        self.bin_dir = bin_dir
+
+    @staticmethod
+    def next_smallest_agg(agg, current_min_intervals):
+
+        for i, interval in enumerate(current_min_intervals):
+            if interval < agg:
+                continue
+            else:
+                return current_min_intervals[i-1]
+        return current_min_intervals[-1]
+
+    def fetch(self, symbol:str, agg, start=None, end=None):
+
+        # Load parameters
+        agg = agg_minutes(agg)
+        pair = symbol.replace('/', '')
+        if agg in CSV_INTERVALS:
+            data_build_flag = False
+            query_agg = agg
+        else:
+            data_build_flag = True
+            query_agg = self.next_smallest_agg(agg, CSV_INTERVALS)
+            print(f"{agg} is not a currently offered interval. Loading the {query_agg} intervals instead and building up to {agg}.")
+
+        # Memory-mapped bars (see bar_store.MemmapBars) are sliced and resampled without loading the whole file:
+        bin_path = f"{self.bin_dir}/{pair}_{query_agg}"
+        if os.path.isdir(bin_path):
+            bars = MemmapBars(bin_path)
+            if data_build_flag:
+                built_path = f"{self.bin_dir}/{pair}_{agg}"
+                if not os.path.isdir(built_path) or MemmapBars(built_path).modified() < bars.modified():
+                    bars.resample(agg, built_path)
+                bars = MemmapBars(built_path)
+            return bars.to_frame(start, end)
+
+        # Load dataset, parsing the csv only when the bar store copy is missing or out of date:
+        csv_path = f"{self.csv_dir}/{pair}_{query_agg}.csv"
+        if self.bar_store.is_stale(pair, query_agg, csv_path):
+            df = pd.read_csv(csv_path, names=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trades'])
+            df.index = pd.to_datetime(df['timestamp'], unit='s')
+            self.bar_store.write(pair, query_agg, df.drop(columns='timestamp'))
+        df = self.bar_store.read(pair, query_agg)
+
+        # Convert to correct interval:
+        if data_build_flag:
+            df = df.resample(f'{agg}T').agg({
+                'open': 'first',
+                'high': 'max',
+                'low': 'min',
+                'close': 'last',
+                'volume': 'sum',
+                'trades': 'sum'
+            })
+            df = df.ffill() # forward fill early NaN's
+
+        # Filter based on start and end time:
+        return df.loc[start:end] if end else df.loc[start:]
+
+
+class StoreSource(BarSource):
+
+    '''
+    Bars kept in the local bar store. With an upstream source, only the ranges the store does not cover
+    are fetched from it; without one, the store is read as it is, e.g. offline.
+    '''
+
+    name = 'store'
+
+    def __init__(self, bar_store:BarStore, upstream:BarSource=None):
+        self.bar_store = bar_store
+        self.upstream = upstream
+
+    def fetch(self, symbol:str, agg, start=None, end=None):
+        if self.upstream is None:
+            keys = [f'kraken_{agg_minutes(agg)}']
+            try:
+                keys.insert(0, AlpacaSource().store_key(agg))
+            except ValueError:
+                pass  # An agg alpaca has no bars for
+            for key in keys:
+                df = self.bar_store.read(symbol, key, start, end)
+                if len(df):
+                    return df
+            return df
+        if start is None and isinstance(self.upstream, RemoteSource):
+            start = self.upstream.first_start(agg, pd.Timestamp.now(tz='UTC').tz_localize(None))
+        return self.bar_store.get(symbol, self.upstream.store_key(agg),
+                                  lambda start, end: self.upstream.fetch(symbol, agg, start, end),
+                                  start, end)
+
+
+class SyntheticSource(BarSource):
+
+    '''
+    Geometric Brownian motion bars, reproducible from a seed, for benchmarks and for testing strategies
+    without any data. Each bar opens at the previous close; highs and lows extend past the open and close
+    by a random fraction of the bar's volatility.
+    '''
+
+    name = 'synthetic'
+
+    def __init__(self, seed:int=0, price:float=100.0, annual_drift:float=0.0, annual_volatility:float=0.8):
+        self.seed = seed
+        self.price = price
+        self.annual_drift = annual_drift
+        self.annual_volatility = annual_volatility
+
+    def bars(self, n:int, agg=60, start='2020-01-01'):
+
+        '''n bars of agg minutes from start.'''
+
+        rng = np.random.default_rng(self.seed)
+        dt = agg_minutes(agg) / (365 * 24 * 60)
+        sigma = self.annual_volatility * np.sqrt(dt)
+        log_returns = (self.annual_drift - self.annual_volatility ** 2 / 2) * dt + sigma * rng.standard_normal(n)
+        close = self.price * np.exp(np.cumsum(log_returns))
+        open_ = np.r_[self.price, close[:-1]]
+        high = np.maximum(open_, close) * np.exp(sigma * np.abs(rng.standard_normal(n)) / 2)
+        low = np.minimum(open_, close) * np.exp(-sigma * np.abs(rng.standard_normal(n)) / 2)
+        volume = rng.lognormal(10, 1, n)
+        index = pd.date_range(start, periods=n, freq=f'{agg_minutes(agg)}min', name='timestamp')
+        return pd.DataFrame(dict(open=open_, high=high, low=low, close=close, volume=volume,
+                                 trades=np.round(volume / 100)), index=index)
+
+    def write_csv(self, path:str, n:int, agg=60, start='2020-01-01'):
+
+        '''n bars written as a headerless csv in the schema of backcast_csv_data (unix seconds, OHLCV, trades).'''
+
+        df = self.bars(n, agg, start)
+        df.insert(0, 'timestamp', df.index.values.astype('datetime64[s]').astype('int64'))
+        df.to_csv(path, header=False, index=False)
+        return path
+
+    def fetch(self, symbol:str, agg, start=None, end=None):
+        start = pd.Timestamp(start) if start is not None else pd.Timestamp('2020-01-01')
+        end = pd.Timestamp(end) if end is not None else start + pd.DateOffset(years=1)
+        n = int((end - start) / pd.Timedelta(minutes=agg_minutes(agg))) + 1
+        return self.bars(n, agg, start)
+
+
+def make_source(name:str, bar_store:BarStore, use_bar_store:bool=True, options:dict=None):
+
+    '''
+    The BarSource named by a strategy_config's source (one of SOURCES), built with its source_options.
+    Remote sources are read through the bar store unless use_bar_store is False.
+    '''
+
+    options = options or dict()
+    if name == 'csv':
+        return CSVSource(bar_store, **options)
+    if name == 'store':
+        return StoreSource(bar_store)
+    if name == 'synthetic':
+        return SyntheticSource(**options)
+    if name == 'alpaca':
+        source = AlpacaSource(**options)
+    elif name == 'kraken':
+        source = KrakenSource(**options)
+    else:
+        raise ValueError(f"Unknown bar source '{name}'. Use one of {SOURCES}.")
+    return StoreSource(bar_store, source) if use_bar_store else source
@@ -0,0 +1,322 @@
+# Standard imports:
+import os
+import json
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Constants:
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'trades']
+
+
+class BarStore:
+
+    '''
+    On-disk OHLCV bars keyed by (symbol, timeframe).
+
+    Each key is one columnar file (Parquet or Feather) with a sorted, tz-naive datetime index, plus a small
+    JSON file listing the date ranges that have already been fetched. get() only asks the fetch function
+    for the parts of a request that are not covered yet, appends them and returns the requested slice.
+    '''
+
+    def __init__(self, root:str='bar_store', fmt:str='parquet'):
+        if fmt not in ('parquet', 'feather'):
+            raise ValueError(f"Unknown bar store format '{fmt}'. Use 'parquet' or 'feather'.")
+        self.root = root
+        self.fmt = fmt
+
+    @staticmethod
+    def _key(symbol:str, timeframe):
+        return f"{symbol.replace('/', '')}_{timeframe}"
+
+    def _data_path(self, symbol:str, timeframe):
+        return os.path.join(self.root, f'{self._key(symbol, timeframe)}.{self.fmt}')
+
+    def _coverage_path(self, symbol:str, timeframe):
+        return os.path.join(self.root, f'{self._key(symbol, timeframe)}.json')
+
+    def coverage(self, symbol:str, timeframe):
+
+        '''Sorted, non-overlapping (start, end) ranges that have been fetched for the key.'''
+
+        path = self._coverage_path(symbol, timeframe)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in json.load(f)]
+
+    def _save_coverage(self, symbol:str, timeframe, ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        with open(self._coverage_path(symbol, timeframe), 'w') as f:
+            json.dump([(str(start), str(end)) for start, end in merged], f)
+
+    def missing_ranges(self, symbol:str, timeframe, start, end):
+
+        '''Parts of [start, end] that are not covered by earlier fetches.'''
+
+        missing = []
+        cursor = pd.Timestamp(start)
+        for covered_start, covered_end in self.coverage(symbol, timeframe):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            missing.append((cursor, pd.Timestamp(end)))
+        return missing
+
+    def read(self, symbol:str, timeframe, start=None, end=None):
+
+        '''
+        Stored bars for the key between start and end (inclusive). An end given as a date covers the whole
+        of that day, like df.loc[start:end] with date strings. Empty if nothing is stored.
+        '''
+
+        path = self._data_path(symbol, timeframe)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name='timestamp'))
+        if self.fmt == 'parquet':
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_feather(path).set_index('timestamp')
+        return df.loc[pd.Timestamp(start) if start else None:_end_of_day(end) if end else None]
+
+    def is_stale(self, symbol:str, timeframe, source_path:str):
+
+        '''True if nothing is stored for the key or the source file changed after it was stored.'''
+
+        path = self._data_path(symbol, timeframe)
+        return not os.path.exists(path) or os.path.getmtime(source_path) > os.path.getmtime(path)
+
+    def write(self, symbol:str, timeframe, df):
+
+        '''Merge bars into the key's file. Bars at an existing timestamp replace the stored ones.'''
+
+        os.makedirs(self.root, exist_ok=True)
+        df = df.copy()
+        df.index = pd.DatetimeIndex(df.index, name='timestamp')
+        stored = self.read(symbol, timeframe)
+        if len(stored):
+            df = pd.concat([stored, df])
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        if self.fmt == 'parquet':
+            df.to_parquet(self._data_path(symbol, timeframe))
+        else:
+            df.reset_index().to_feather(self._data_path(symbol, timeframe))
+
+    def get(self, symbol:str, timeframe, fetch, start=None, end=None):
+
+        '''
+        Bars for the key between start and end, fetching only what is missing.
+
+        fetch(start, end) must return an OHLCV DataFrame with a datetime index. A missing start means the
+        earliest available bar, a missing end means now and an end given as a date covers that whole day.
+        As later bars don't exist yet and the latest one may still be forming, a fetch reaching now is only
+        recorded as covered up to its last bar, which is fetched again next time.
+        '''
+
+        now = pd.Timestamp.now(tz='UTC').tz_localize(None)
+        request_start = pd.Timestamp(start) if start else pd.Timestamp('1970-01-01')
+        request_end = _end_of_day(end) if end else now
+
+        missing = self.missing_ranges(symbol, timeframe, request_start, request_end)
+        if missing:
+            covered = self.coverage(symbol, timeframe)
+            for missing_start, missing_end in missing:
+                bars = fetch(missing_start, missing_end)
+                if len(bars):
+                    self.write(symbol, timeframe, bars)
+                if missing_end >= now:
+                    missing_end = bars.index[-1] if len(bars) else missing_start
+                covered.append((missing_start, missing_end))
+            self._save_coverage(symbol, timeframe, covered)
+
+        return self.read(symbol, timeframe, request_start, request_end if end else None)
+
+
+class MemmapBars:
+
+    '''
+    Bars stored as one flat binary file per column and opened with np.memmap.
+
+    timestamp is int64 unix seconds and every other column is float64, so a date range is found with a
+    binary search on the timestamps and only the pages of that range are read from disk. Years of
+    minute bars can be sliced or resampled without loading the whole file into memory.
+    '''
+
+    columns = OHLCV_COLUMNS
+    dtypes = dict(timestamp='int64', **{col: 'float64' for col in OHLCV_COLUMNS})
+
+    def __init__(self, path:str, create:bool=False):
+
+        '''Opens the bars in the directory path. Only writers pass create, to make the directory if it is missing.'''
+
+        if create:
+            os.makedirs(path, exist_ok=True)
+        elif not os.path.isdir(path):
+            raise FileNotFoundError(f'No memory-mapped bars at {path}.')
+        self.path = path
+
+    def _column_path(self, col:str):
+        return os.path.join(self.path, f'{col}.bin')
+
+    def __len__(self):
+        path = self._column_path('timestamp')
+        return os.path.getsize(path) // 8 if os.path.exists(path) else 0
+
+    def modified(self):
+
+        '''Last time bars were written, or 0 if there are none.'''
+
+        return os.path.getmtime(self._column_path('timestamp')) if len(self) else 0
+
+    def column(self, col:str):
+
+        '''Read-only memmap of a whole column.'''
+
+        if not len(self):
+            return np.empty(0, dtype=self.dtypes[col])
+        return np.memmap(self._column_path(col), dtype=self.dtypes[col], mode='r')
+
+    def clear(self):
+        for col in self.dtypes:
+            if os.path.exists(self._column_path(col)):
+                os.remove(self._column_path(col))
+
+    def append(self, timestamps, **columns):
+
+        '''Append bars to the end of every column file. Timestamps must be later than the stored ones.'''
+
+        for col, values in dict(timestamp=timestamps, **columns).items():
+            with open(self._column_path(col), 'ab') as f:
+                f.write(np.ascontiguousarray(values, dtype=self.dtypes[col]).tobytes())
+
+    def append_frame(self, df):
+        timestamps = df.index.values.astype('datetime64[s]').astype('int64')
+        self.append(timestamps, **{col: df[col].to_numpy() for col in self.columns})
+
+    def index_range(self, start=None, end=None):
+
+        '''
+        Positions [first, last) of the bars between two dates. Both dates are inclusive, like
+        df.loc[start:end] with date strings, so end covers the whole of that day.
+        '''
+
+        timestamps = self.column('timestamp')
+        first = np.searchsorted(timestamps, _to_seconds(start)) if start else 0
+        last = np.searchsorted(timestamps, _to_seconds(end, end_of_day=True), side='right') if end else len(timestamps)
+        return first, last
+
+    def to_frame(self, start=None, end=None):
+
+        '''Materialize only the bars between start and end as an OHLCV DataFrame.'''
+
+        first, last = self.index_range(start, end)
+        index = pd.to_datetime(np.array(self.column('timestamp')[first:last]), unit='s')
+        return pd.DataFrame({col: np.array(self.column(col)[first:last]) for col in self.columns},
+                            index=pd.DatetimeIndex(index, name='timestamp'))
+
+    @classmethod
+    def from_csv(cls, csv_path:str, path:str, chunksize:int=1_000_000):
+
+        '''Convert a Kraken-style OHLCV csv (unix seconds in the first column) chunk by chunk.'''
+
+        bars = cls(path, create=True)
+        for chunk in pd.read_csv(csv_path, names=['timestamp'] + OHLCV_COLUMNS, chunksize=chunksize):
+            bars.append(chunk['timestamp'], **{col: chunk[col] for col in OHLCV_COLUMNS})
+        return bars
+
+    def resample(self, minutes:int, path:str, chunk_rows:int=1_000_000):
+
+        '''
+        Aggregate into bars of the given length and write them to a new MemmapBars at path.
+
+        Works through the source in chunks of about chunk_rows bars, cut at bucket boundaries, so memory use
+        does not depend on the size of the file. Buckets start at midnight of the first day and empty
+        buckets are forward filled with zero volume, matching
+        df.resample(f'{minutes}T').agg({...}).ffill() in bar_sources.CSVSource.fetch.
+        '''
+
+        out = MemmapBars(path, create=True)
+        out.clear()
+        timestamps = self.column('timestamp')
+        if not len(timestamps):
+            return out
+        width = minutes * 60
+        origin = int(timestamps[0]) - int(timestamps[0]) % 86400
+        carry = None  # Last bucket of the previous chunk and its OHLC, for forward filling gaps
+
+        first = 0
+        while first < len(timestamps):
+            last = min(first + chunk_rows, len(timestamps))
+            if last < len(timestamps):
+                # End the chunk where the bucket of its last row starts, so no bucket is split across chunks:
+                boundary = origin + (int(timestamps[last - 1]) - origin) // width * width
+                last = np.searchsorted(timestamps, boundary)
+                if last <= first:
+                    last = np.searchsorted(timestamps, boundary + width)
+            buckets = (np.asarray(timestamps[first:last]) - origin) // width
+            chunk = {col: np.asarray(self.column(col)[first:last]) for col in self.columns}
+
+            # Aggregate rows sharing a bucket:
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            ends = np.r_[starts[1:], len(buckets)] - 1
+            present = buckets[starts]
+            agg = dict(open=chunk['open'][starts],
+                       high=np.maximum.reduceat(chunk['high'], starts),
+                       low=np.minimum.reduceat(chunk['low'], starts),
+                       close=chunk['close'][ends],
+                       volume=np.add.reduceat(chunk['volume'], starts),
+                       trades=np.add.reduceat(chunk['trades'], starts))
+
+            # Every bucket from the one after the previous chunk's last bucket, empty ones forward filled:
+            first_bucket = carry[0] + 1 if carry else present[0]
+            all_buckets = np.arange(first_bucket, present[-1] + 1)
+            position = np.full(len(all_buckets), -1)
+            position[present - first_bucket] = np.arange(len(present))
+            filled = np.maximum.accumulate(position)
+            result = dict()
+            for col in ['open', 'high', 'low', 'close']:
+                values = np.append(agg[col], carry[1][col] if carry else np.nan)
+                result[col] = values[filled]  # -1 picks the carried value
+            for col in ['volume', 'trades']:
+                result[col] = np.where(position >= 0, agg[col][position], 0.0)
+            out.append(origin + all_buckets * width, **result)
+
+            carry = (all_buckets[-1], {col: result[col][-1] for col in ['open', 'high', 'low', 'close']})
+            first = last
+        return out
+
+
+def _end_of_day(dt):
+
+    '''The last second of the day for a date, given as a string or a midnight timestamp. Other times pass through.'''
+
+    dt = pd.Timestamp(dt)
+    if dt == dt.normalize():
+        dt = dt + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return dt
+
+
+def _to_seconds(dt, end_of_day:bool=False):
+    dt = _end_of_day(dt) if end_of_day else pd.Timestamp(dt)
+    return int(dt.value // 10**9)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert an OHLCV csv to memory-mapped bar arrays.')
+    parser.add_argument('--csv', help='Path to the csv, e.g. backcast_csv_data/ETHUSD_1.csv')
+    parser.add_argument('--out', help='Directory for the column files, e.g. backcast_bin_data/ETHUSD_1')
+    args = parser.parse_args()
+    print(f'Wrote {len(MemmapBars.from_csv(args.csv, args.out))} bars to {args.out}')
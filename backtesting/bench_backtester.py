@@ -0,0 +1,201 @@
+# Standard imports:
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import time
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Local application imports:
+from backtester import load_strategy_file, build_backtest
+from bar_store import BarStore, MemmapBars
+from bar_sources import SyntheticSource, CSVSource
+from reports import REPORT_FORMATS, report_payload, write_report
+from sweep import grid_samples, _init_worker, _run_one
+
+# Constants:
+BENCHMARKS = ['generate', 'load_csv', 'load_store', 'csv_to_memmap', 'load_memmap', 'resample',
+              'per_bar', 'vectorized', 'report', 'sweep']
+SWEEP_SPACE = dict(FAST=[5, 10, 15, 20], SLOW=[30, 50])  # Parameters of the default SMA10_20 config
+HARDWARE = ['machine', 'processor', 'cpus']  # environment() keys a baseline is only comparable across
+
+
+def time_call(func, repeats:int, setup=None):
+
+    '''Wall time of func, one sample per repeat, with setup run untimed before each. Prints are silenced.'''
+
+    samples = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def environment():
+    return dict(python=platform.python_version(), numpy=np.__version__, pandas=pd.__version__,
+                machine=platform.machine(), processor=platform.processor(), cpus=os.cpu_count())
+
+
+def environment_mismatch(baseline):
+
+    '''The hardware keys on which the baseline's machine differs from this one, as {key: (baseline, here)}.'''
+
+    here = environment()
+    recorded = baseline.get('environment', dict())
+    return {key: (recorded.get(key), here[key]) for key in HARDWARE if recorded.get(key) != here[key]}
+
+
+def run_suite(sizes, repeats:int=3, strategy_config_file:str='backtest_config_files.SMA10_20_config',
+              benchmarks=BENCHMARKS, per_bar_limit:int=20_000, report_format:str='html', workers:int=None, seed:int=0):
+
+    '''
+    Times every benchmark at every size of synthetic hourly bars and returns one record per (benchmark, bars)
+    with the median and fastest of the samples. The per-bar loop is skipped above per_bar_limit bars.
+    '''
+
+    strategy_file = load_strategy_file(strategy_config_file)
+    source = SyntheticSource(seed=seed)
+    results = []
+    root = tempfile.mkdtemp(prefix='bench_')
+    try:
+        for n in sizes:
+            directory = os.path.join(root, str(n))
+            csv_dir, bin_dir, store_dir = [os.path.join(directory, name) for name in ('csv', 'bin', 'store')]
+            for path in (csv_dir, bin_dir):
+                os.makedirs(path)
+            source.write_csv(os.path.join(csv_dir, 'ETHUSD_60.csv'), n)
+            csv_source = CSVSource(BarStore(store_dir), csv_dir=csv_dir, bin_dir=bin_dir)
+            data = source.bars(n)
+            memmap_path = os.path.join(directory, 'memmap')
+            resampled_path = os.path.join(directory, 'memmap_240')
+
+            def run(vectorized:bool):
+                backtest = build_backtest(strategy_file)
+                backtest.backcast_data = data
+                backtest.benchmarks = []  # Offline and deterministic
+                backtest.run_backcast(vectorized=vectorized)
+                return backtest
+
+            def sweep():
+                samples = grid_samples(SWEEP_SPACE)
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(strategy_config_file, data, True)) as pool:
+                    list(pool.map(_run_one, samples))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                finished = run(True)
+            cases = dict(generate=(lambda: source.bars(n), None),
+                         load_csv=(lambda: csv_source.fetch('ETH/USD', 60), lambda: shutil.rmtree(store_dir, ignore_errors=True)),
+                         load_store=(lambda: csv_source.fetch('ETH/USD', 60), None),
+                         csv_to_memmap=(lambda: MemmapBars.from_csv(os.path.join(csv_dir, 'ETHUSD_60.csv'), memmap_path),
+                                        lambda: shutil.rmtree(memmap_path, ignore_errors=True)),
+                         load_memmap=(lambda: MemmapBars(memmap_path).to_frame(), None),
+                         resample=(lambda: MemmapBars(memmap_path).resample(240, resampled_path),
+                                   lambda: shutil.rmtree(resampled_path, ignore_errors=True)),
+                         per_bar=(lambda: run(False), None),
+                         vectorized=(lambda: run(True), None),
+                         report=(lambda: write_report(report_payload(finished), report_format, directory), None),
+                         sweep=(sweep, None))
+
+            for name in benchmarks:
+                if name == 'per_bar' and n > per_bar_limit:
+                    print(f'{name:>14} {n:>10} bars  skipped, above --per_bar_limit')
+                    continue
+                func, setup = cases[name]
+                samples = time_call(func, repeats, setup)
+                median = statistics.median(samples)
+                results.append(dict(benchmark=name, bars=n, seconds=median, min_seconds=min(samples),
+                                    repeats=repeats, bars_per_second=n / median if median else None))
+                print(f'{name:>14} {n:>10} bars  {median:9.4f}s  {n / median:14,.0f} bars/s')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def flag_regressions(results, baseline, tolerance:float=0.25, min_seconds:float=0.01):
+
+    '''
+    Marks every result that is more than tolerance slower than the same benchmark and size in the baseline.
+    Differences under min_seconds are timer noise and never count. Returns the regressed records.
+    '''
+
+    previous = {(row['benchmark'], row['bars']): row['seconds'] for row in baseline['results']}
+    regressions = []
+    for row in results:
+        seconds = previous.get((row['benchmark'], row['bars']))
+        if seconds is None:
+            continue
+        row['baseline_seconds'] = seconds
+        row['change'] = row['seconds'] / seconds - 1 if seconds else None
+        row['regression'] = row['seconds'] > seconds * (1 + tolerance) and row['seconds'] - seconds > min_seconds
+        if row['regression']:
+            regressions.append(row)
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Times data loading, resampling, both backtest engines, reports and sweeps '
+                                                 'on synthetic bars of increasing size, and flags regressions against a baseline.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma separated numbers of bars, e.g. 10000,10000000.')
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS), help=f'Comma separated subset of {BENCHMARKS}.')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--strategy_config_file', default='backtest_config_files.SMA10_20_config')
+    parser.add_argument('--per_bar_limit', type=int, default=20_000, help='Largest size the per-bar loop is timed at.')
+    parser.add_argument('--report_format', default='html', choices=REPORT_FORMATS)
+    parser.add_argument('--workers', type=int, default=None, help='Sweep worker processes. Defaults to all cores.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Results JSON. Defaults to backtest_summaries/bench_<timestamp>.json.')
+    parser.add_argument('--baseline', default='bench_baseline.json', help='Results JSON to compare against, if it exists.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Slowdown over the baseline that counts as a regression.')
+    parser.add_argument('--save_baseline', action='store_true', help='Also write these results to --baseline.')
+    parser.add_argument('--ignore_environment', action='store_true',
+                        help='Compare against a baseline recorded on different hardware anyway.')
+    args = parser.parse_args()
+
+    unknown = set(args.benchmarks.split(',')) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'Unknown benchmarks {sorted(unknown)}. Use some of {BENCHMARKS}.')
+    results = run_suite([int(n) for n in args.sizes.split(',')], args.repeats, args.strategy_config_file,
+                        args.benchmarks.split(','), args.per_bar_limit, args.report_format, args.workers, args.seed)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatch = environment_mismatch(baseline)
+        if mismatch and not args.ignore_environment:
+            print(f'{args.baseline} was recorded on different hardware {mismatch}. Timings are not comparable, skipping '
+                  f'the regression check. Record a baseline here with --save_baseline, or pass --ignore_environment.')
+            baseline = dict(results=[])
+        regressions = flag_regressions(results, baseline, args.tolerance)
+        for row in regressions:
+            print(f"REGRESSION {row['benchmark']} at {row['bars']} bars: {row['seconds']:.4f}s vs "
+                  f"{row['baseline_seconds']:.4f}s baseline ({row['change']:+.0%})")
+        print(f'{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%}).')
+
+    report = dict(created=datetime.now().isoformat(timespec='seconds'), environment=environment(),
+                  strategy_config_file=args.strategy_config_file, seed=args.seed, results=results)
+    output = args.output or f"backtest_summaries/bench_{datetime.now().strftime('%Y-%m-%d_%H%M')}.json"
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    paths = [output, args.baseline] if args.save_baseline else [output]
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"Results saved to {' and '.join(paths)}")
+    sys.exit(1 if regressions else 0)
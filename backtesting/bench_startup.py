@@ -0,0 +1,49 @@
+# Standard imports:
+import sys
+import argparse
+import statistics
+import subprocess
+import time
+
+
+def time_import(module:str, repeats:int):
+
+    '''Wall time of a fresh interpreter importing the module, one sample per repeat.'''
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import {module}'], check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def slowest_imports(module:str, top:int):
+
+    '''Modules with the largest cumulative import time, from python -X importtime.'''
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measures how long it takes to import a module, e.g. backtester.')
+    parser.add_argument('--module', default='backtester')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest imports to list.')
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_import('sys', args.repeats))
+    samples = time_import(args.module, args.repeats)
+    print(f'import {args.module}: median {statistics.median(samples):.3f}s, min {min(samples):.3f}s '
+          f'(bare interpreter {baseline:.3f}s)')
+    for cumulative, name in slowest_imports(args.module, args.top):
+        print(f'{cumulative / 1e6:8.3f}s  {name}')
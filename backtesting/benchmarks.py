@@ -0,0 +1,71 @@
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Constants:
+BENCHMARK_TIMEFRAME = '1Day'
+
+
+def fetch_yahoo(symbol:str, start, end):
+
+    '''Daily OHLCV bars of any Yahoo Finance ticker (SPY, ^GSPC, BTC-USD, ...) between two dates.'''
+
+    import yfinance as yf
+    df = yf.download(symbol, start=start, end=end + pd.Timedelta(days=1), progress=False, auto_adjust=False)
+    if df.empty:
+        # yfinance reports failed downloads as empty frames. Raise, so the bar store does not mark the range as fetched:
+        raise ValueError(f'no bars returned for {symbol}')
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df = df.rename(columns=str.lower)[['open', 'high', 'low', 'close', 'volume']]
+    df.index = pd.DatetimeIndex(df.index).tz_localize(None)
+    return df
+
+
+def load_benchmarks(bar_store, symbols, start, end):
+
+    '''
+    Daily closes of each benchmark symbol from the bar store. Yahoo Finance is only asked for the dates the
+    store does not hold yet. If that fails (e.g. offline) the stored bars are used as they are, and a
+    benchmark with no stored bars is left out.
+    '''
+
+    closes = dict()
+    for symbol in symbols:
+        try:
+            bars = bar_store.get(symbol, BENCHMARK_TIMEFRAME, lambda start, end: fetch_yahoo(symbol, start, end), start, end)
+        except Exception as e:
+            bars = bar_store.read(symbol, BENCHMARK_TIMEFRAME, start, end)
+            print(f'Could not fetch benchmark {symbol} ({e}). Using the {len(bars)} stored bars.')
+        if len(bars):
+            closes[symbol] = bars['close']
+    return closes
+
+
+def align(timestamps, close):
+
+    '''The last close at or before each timestamp, NaN before the first one.'''
+
+    positions = np.searchsorted(close.index.values, timestamps.values, side='right') - 1
+    return np.where(positions >= 0, close.to_numpy(dtype='float64')[np.maximum(positions, 0)], np.nan)
+
+
+def comparison_curves(backtest, benchmarks=('SPY',)):
+
+    '''
+    The strategy's equity, buy and hold of the traded pair and every benchmark as arrays on the backcast's
+    timestamps, each scaled to the starting capital at the first bar the backcast evaluated.
+    '''
+
+    df = backtest.backcast_data
+    first_bar = backtest.periods_needed - 1
+    curves = dict(strategy=backtest.curves['equity'], buy_and_hold=df['close'].to_numpy(dtype='float64'))
+    closes = load_benchmarks(backtest.bar_store, benchmarks, df.index[0].normalize(), df.index[-1].normalize())
+    curves.update({symbol: align(df.index, close) for symbol, close in closes.items()})
+
+    for name, values in curves.items():
+        values = values.copy()
+        values[:first_bar] = np.nan
+        valid = np.flatnonzero(~np.isnan(values))
+        curves[name] = values / values[valid[0]] * backtest.starting_capital if len(valid) else values
+    return curves
@@ -0,0 +1,94 @@
+# Standard imports:
+import io
+import sys
+import ast
+import argparse
+import contextlib
+
+# Third party imports:
+import numpy as np
+
+# Local application imports:
+from backtester import load_strategy_file, build_backtest
+from sweep import apply_params
+
+# Constants:
+CONFIGS = ['backtest_config_files.MACD_03stoploss_config', 'backtest_config_files.SMA10_20_config',
+           'backtest_config_files.SMA50_5_config']
+
+
+def parse_params(text:str):
+
+    '''FAST=5,SLOW=60 -> dict(FAST=5, SLOW=60).'''
+
+    params = dict()
+    for item in filter(None, text.split(',')):
+        key, value = item.split('=')
+        params[key.strip()] = ast.literal_eval(value.strip())
+    return params
+
+
+def compare_engines(strategy_config_file:str, agg:int=None, start:str=None, end:str=None, params:dict=None):
+
+    '''
+    Runs one config through the per-bar loop and the vectorized signals() path on the same bundled csv bars.
+    Returns a list of the differences in trades, final capital and curves. An empty list means they agree.
+    '''
+
+    strategy_file = load_strategy_file(strategy_config_file)
+    strategy_file.strategy_config['source'] = 'csv'
+    for key, value in dict(agg=agg, start=start, end=end).items():
+        if value is not None:
+            strategy_file.strategy_config[key] = value
+    apply_params(strategy_file, params or dict())
+    if not getattr(strategy_file, 'signals', None):
+        return [f'{strategy_config_file} has no signals(df), so only the per-bar engine runs it.']
+
+    runs = []
+    data = None
+    for vectorized in (False, True):
+        backtest = build_backtest(strategy_file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if data is None:
+                data = backtest.load_data()
+            backtest.backcast_data = data.copy()
+            backtest.run_backcast(vectorized=vectorized)
+        runs.append(backtest)
+    per_bar, vectorized = runs
+
+    differences = []
+    if len(per_bar.trades) != len(vectorized.trades):
+        differences.append(f'{len(per_bar.trades)} per-bar trades vs {len(vectorized.trades)} vectorized')
+    elif not per_bar.trades.equals(vectorized.trades):
+        row = (per_bar.trades != vectorized.trades).any(axis=1).to_numpy().argmax()
+        differences.append(f'trade {row} differs:\n{per_bar.trades.iloc[row].to_string()}\nvs\n{vectorized.trades.iloc[row].to_string()}')
+    if per_bar.capital != vectorized.capital:
+        differences.append(f'final capital {per_bar.capital} vs {vectorized.capital}')
+    for col, curve in per_bar.curves.items():
+        if not np.array_equal(curve, vectorized.curves[col], equal_nan=True):
+            differences.append(f'{col} curve differs')
+    return differences
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Checks that the vectorized engine makes the same trades as the per-bar loop '
+                                                 'on the bundled csv bars. Exits 1 if any config disagrees.')
+    parser.add_argument('--strategy_config_files', default=','.join(CONFIGS), help='Comma separated config modules.')
+    parser.add_argument('--aggs', default='240,1440', help='Comma separated bar sizes in minutes.')
+    parser.add_argument('--start', default=None, help="Overrides the configs' start dates.")
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--params', default='', help='Strategy parameters to check with, e.g. FAST=5,SLOW=60.')
+    args = parser.parse_args()
+
+    failed = 0
+    params = parse_params(args.params)
+    for strategy_config_file in args.strategy_config_files.split(','):
+        for agg in [int(agg) for agg in args.aggs.split(',')]:
+            differences = compare_engines(strategy_config_file, agg, args.start, args.end, params)
+            print(f"{'OK  ' if not differences else 'FAIL'} {strategy_config_file} at {agg} minutes {params or ''}")
+            for difference in differences:
+                print(f'    {difference}')
+            failed += bool(differences)
+    print(f'{failed} configs disagree.' if failed else 'The engines agree.')
+    sys.exit(1 if failed else 0)
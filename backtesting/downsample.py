@@ -0,0 +1,57 @@
+# Third party imports:
+import numpy as np
+
+
+def lttb(y, n_out:int, x=None, keep=None):
+
+    '''
+    Largest-triangle-three-buckets: positions of about n_out points of y that keep its visual shape.
+
+    The first and last points are always kept. Every bucket in between contributes the point forming the
+    largest triangle with the point kept from the previous bucket and the mean of the next bucket, which
+    keeps spikes and reversals that uniform sampling drops. Positions in keep (e.g. trade entries and exits)
+    are added on top. NaNs are skipped. x defaults to the positions, for evenly spaced bars.
+    '''
+
+    y = np.asarray(y, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(y))
+    x = np.arange(len(y), dtype='float64') if x is None else np.asarray(x, dtype='float64')
+    if len(valid) <= n_out or n_out < 3:
+        selected = valid
+    else:
+        vx, vy = x[valid], y[valid]
+        edges = np.linspace(1, len(valid) - 1, n_out - 1).astype(int)  # n_out - 2 buckets between the end points
+        selected = np.empty(n_out, dtype=int)
+        selected[0], selected[-1] = 0, len(valid) - 1
+        previous = 0
+        for k in range(n_out - 2):
+            start, end = edges[k], edges[k + 1]
+            next_end = edges[k + 2] if k + 2 < len(edges) else len(valid)
+            next_x, next_y = vx[end:next_end].mean(), vy[end:next_end].mean()
+            area = np.abs((vx[previous] - next_x) * (vy[start:end] - vy[previous])
+                          - (vx[previous] - vx[start:end]) * (next_y - vy[previous]))
+            previous = start + int(np.argmax(area))
+            selected[k + 1] = previous
+        selected = valid[selected]
+    if keep is not None and len(keep):
+        keep = np.asarray(keep, dtype=int)
+        keep = keep[(keep >= 0) & (keep < len(y))]
+        selected = np.union1d(selected, keep[~np.isnan(y[keep])])
+    return selected
+
+
+def ohlc_buckets(open_, high, low, close, n_out:int):
+
+    '''
+    Candlesticks merged into at most n_out candles: first open, highest high, lowest low and last close of
+    each bucket of consecutive bars, so no high or low is lost. Returns the position of every bucket's first
+    bar and the four merged arrays.
+    '''
+
+    n = len(close)
+    if n <= n_out:
+        return np.arange(n), np.asarray(open_), np.asarray(high), np.asarray(low), np.asarray(close)
+    starts = np.unique(np.linspace(0, n, n_out, endpoint=False).astype(int))
+    ends = np.r_[starts[1:], n] - 1
+    return (starts, np.asarray(open_)[starts], np.maximum.reduceat(np.asarray(high), starts),
+            np.minimum.reduceat(np.asarray(low), starts), np.asarray(close)[ends])
@@ -0,0 +1,76 @@
+# Standard imports:
+import os
+
+# Third party imports:
+import numpy as np
+
+# Local application imports:
+from bar_store import MemmapBars
+
+
+class DrillDown:
+
+    '''
+    Decides whether a coarse bar that touched both the stop loss and the take profit hit the stop first,
+    by replaying that bar's 1m/5m bars.
+
+    The fine bars are a MemmapBars directory, so nothing is read up front. The first lookup builds the
+    coarse-to-fine index, the offset of every coarse bar's first fine bar, with a single vectorized
+    np.searchsorted of all the coarse bar starts into the timestamp column. After that each ambiguous bar
+    reads only its own fine rows.
+    '''
+
+    def __init__(self, fine_bars:MemmapBars, coarse_index):
+        self.fine_bars = fine_bars
+        self.coarse_index = coarse_index
+        self._offsets = None
+        self.resolved = dict()  # (bar, levels) -> 'stop' or 'take_profit', for the bars drilled into
+
+    @classmethod
+    def from_local_data(cls, pair:str, agg:int, coarse_index):
+
+        '''
+        Opens backcast_bin_data/{pair}_{agg}, converting backcast_csv_data/{pair}_{agg}.csv to it the first
+        time. None if there is no data at that interval.
+        '''
+
+        bin_path = f'backcast_bin_data/{pair}_{agg}'
+        csv_path = f'backcast_csv_data/{pair}_{agg}.csv'
+        if not os.path.isdir(bin_path):
+            if not os.path.exists(csv_path):
+                print(f'No {agg} minute bars for {pair}. Bars that hit the stop loss and take profit take the stop loss.')
+                return None
+            MemmapBars.from_csv(csv_path, bin_path)
+        return cls(MemmapBars(bin_path), coarse_index)
+
+    def offsets(self):
+
+        '''Fine-bar offset of the start of every coarse bar, plus the end of the last one.'''
+
+        if self._offsets is None:
+            bounds = self.coarse_index.values.astype('datetime64[s]').astype('int64')
+            if len(bounds) > 1:
+                bounds = np.r_[bounds, bounds[-1] + (bounds[-1] - bounds[-2])]
+            self._offsets = np.searchsorted(self.fine_bars.column('timestamp'), bounds)
+        return self._offsets
+
+    def first_touch(self, bar:int, stop_price:float, take_profit_price:float, take_profit_on:str='close'):
+
+        '''
+        'stop' or 'take_profit', whichever level the fine bars inside the coarse bar reached first. Stops are
+        checked against each fine bar's low and take profits against its take_profit_on column ('close' as
+        in run_backcast, 'high' for the fill model). A fine bar that touches both, or no fine data, gives
+        'stop'.
+        '''
+
+        key = (bar, stop_price, take_profit_price, take_profit_on)
+        if key not in self.resolved:
+            offsets = self.offsets()
+            first, last = offsets[bar], offsets[bar + 1]
+            stop_hits = np.flatnonzero(self.fine_bars.column('low')[first:last] <= stop_price)
+            take_profit_hits = np.flatnonzero(self.fine_bars.column(take_profit_on)[first:last] >= take_profit_price)
+            if len(take_profit_hits) and (not len(stop_hits) or take_profit_hits[0] < stop_hits[0]):
+                self.resolved[key] = 'take_profit'
+            else:
+                self.resolved[key] = 'stop'
+        return self.resolved[key]
@@ -0,0 +1,133 @@
+# Third party imports:
+import numpy as np
+
+
+class FillModel:
+
+    '''
+    Simulates order fills from OHLC bars, with fees and slippage.
+
+    Entries are market orders filled at the signal bar's close, or limit orders placed limit_offset below
+    that close and filled on a later bar whose low reaches them (at the open if it gapped below), expiring
+    after limit_expiry bars. Exits are a stop loss and/or a trailing stop (stop orders, filled at the level
+    or at the open if the bar gapped through it), a take profit (limit order, filled at the level or a
+    better open), or a sell signal (market order at the close).
+
+    The stop and take profit are checked against each bar's low and high, so they trigger before a sell
+    signal at the same bar's close. When one bar touches both, resolve_first_touch decides which came first:
+    by default the level nearer the open, assuming the bar went O-H-L-C or O-L-H-C. Every check is an array
+    operation over the bars a trade is held, so there is no Python work per bar.
+
+    Fees are fee_bps of every fill's notional. Slippage moves market and stop fills against the trade by
+    slippage_bps of the price plus range_slippage times the bar's high - low.
+    '''
+
+    def __init__(self, fee_bps:float=0, slippage_bps:float=0, range_slippage:float=0, entry_order:str='market',
+                 limit_offset:float=0, limit_expiry:int=1, stop_loss=None, take_profit=None, trailing_stop=None):
+        if entry_order not in ('market', 'limit'):
+            raise ValueError(f"Unknown entry order '{entry_order}'. Use 'market' or 'limit'.")
+        self.fee = fee_bps / 1e4
+        self.slippage = slippage_bps / 1e4
+        self.range_slippage = range_slippage
+        self.entry_order = entry_order
+        self.limit_offset = limit_offset
+        self.limit_expiry = limit_expiry
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.trailing_stop = trailing_stop
+        self.drilldown = None  # A DrillDown, set by run_backcast when the config asks for drilldown_agg
+        self.open = self.high = self.low = self.close = None
+
+    @classmethod
+    def from_config(cls, config:dict):
+
+        '''A FillModel if the strategy_config sets any fill option, else None (fills at the close, no costs).'''
+
+        options = ['fee_bps', 'slippage_bps', 'range_slippage', 'entry_order', 'limit_offset', 'limit_expiry', 'trailing_stop']
+        if not any(config.get(option) for option in options):
+            return None
+        return cls(stop_loss=config.get('stop_loss'), take_profit=config.get('take_profit'),
+                   **{option: config[option] for option in options if config.get(option) is not None})
+
+    def bind(self, df):
+        self.open = df['open'].to_numpy(dtype='float64')
+        self.high = df['high'].to_numpy(dtype='float64')
+        self.low = df['low'].to_numpy(dtype='float64')
+        self.close = df['close'].to_numpy(dtype='float64')
+        return self
+
+    def _slip(self, bar:int, price:float):
+        return price * self.slippage + self.range_slippage * (self.high[bar] - self.low[bar])
+
+    def entry(self, signal_bar:int, last_bar:int):
+
+        '''(bar, price) of the entry fill for a buy signal, or None if a limit order expired unfilled.'''
+
+        price = self.close[signal_bar]
+        if self.entry_order == 'market':
+            return signal_bar, price + self._slip(signal_bar, price)
+        limit = price * (1 - self.limit_offset)
+        window = slice(signal_bar + 1, min(signal_bar + self.limit_expiry, last_bar) + 1)
+        hits = np.flatnonzero(self.low[window] <= limit)
+        if not len(hits):
+            return None
+        bar = signal_bar + 1 + hits[0]
+        return bar, min(self.open[bar], limit)
+
+    def resolve_first_touch(self, bar:int, stop_level:float, take_profit_level:float):
+
+        '''
+        Which of the two levels a bar that touched both reached first: 'stop' or 'take_profit'. Replays the
+        bar's finer bars when there is a drilldown, otherwise guesses from the open.
+        '''
+
+        if self.drilldown:
+            return self.drilldown.first_touch(bar, stop_level, take_profit_level, take_profit_on='high')
+        return 'take_profit' if self.high[bar] - self.open[bar] < self.open[bar] - self.low[bar] else 'stop'
+
+    def exit(self, entry_bar:int, entry_price:float, sell_bar, last_bar:int):
+
+        '''
+        (bar, price, reason) of the exit fill, reason being 'stop', 'take_profit' or 'signal'. None if the
+        position is still open at last_bar.
+        '''
+
+        end = sell_bar if sell_bar is not None else last_bar
+        held = slice(entry_bar + 1, end + 1)
+        n = end - entry_bar
+        if n <= 0:
+            return None
+
+        # Stop level per bar: the fixed stop, raised by the trailing stop as the high since entry climbs:
+        stop_level = np.full(n, entry_price * (1 - self.stop_loss) if self.stop_loss else -np.inf)
+        if self.trailing_stop:
+            # Highest price since the fill, before each held bar: the entry price, then the highs of the held bars.
+            # The entry bar's high may have come before the fill, and a bar's own high can't raise its stop:
+            peak = np.maximum.accumulate(np.concatenate(([entry_price], self.high[entry_bar + 1:end])))
+            stop_level = np.maximum(stop_level, peak * (1 - self.trailing_stop))
+        take_profit_level = entry_price * (1 + self.take_profit) if self.take_profit else np.inf
+
+        stop_hits = np.flatnonzero(self.low[held] <= stop_level)
+        take_profit_hits = np.flatnonzero(self.high[held] >= take_profit_level)
+        first_stop = stop_hits[0] if len(stop_hits) else n
+        first_take_profit = take_profit_hits[0] if len(take_profit_hits) else n
+
+        if first_stop < n and (first_stop < first_take_profit or (first_stop == first_take_profit and
+                self.resolve_first_touch(entry_bar + 1 + first_stop, stop_level[first_stop], take_profit_level) == 'stop')):
+            bar = entry_bar + 1 + first_stop
+            price = min(self.open[bar], stop_level[first_stop])
+            return bar, price - self._slip(bar, price), 'stop'
+        if first_take_profit < n:
+            bar = entry_bar + 1 + first_take_profit
+            return bar, max(self.open[bar], take_profit_level), 'take_profit'
+        if sell_bar is not None:
+            price = self.close[sell_bar]
+            return sell_bar, price - self._slip(sell_bar, price), 'signal'
+        return None
+
+    def close_out(self, bar:int):
+
+        '''Price of a market sell at the close, used to close positions at the end of the backcast.'''
+
+        price = self.close[bar]
+        return price - self._slip(bar, price)
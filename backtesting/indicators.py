@@ -0,0 +1,256 @@
+# Standard imports:
+import math
+from collections import deque
+
+# Third party imports:
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _ewm_weights(span:int, length:int):
+
+    '''Weights that reproduce ewm(span=span, adjust=False).mean()[-1] over a series of the given length.'''
+
+    alpha = 2 / (span + 1)
+    weights = alpha * (1 - alpha) ** np.arange(length - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (length - 1)
+    return weights
+
+
+def _pad_back(values, length:int):
+    return np.concatenate([values, np.zeros(length - len(values))])
+
+
+def _apply_window(values, weights):
+
+    '''Dot every trailing window of the series with the weights. Bars without a full window are NaN.'''
+
+    values = np.asarray(values, dtype='float64')
+    out = np.full(len(values), np.nan)
+    if len(values) >= len(weights):
+        out[len(weights) - 1:] = sliding_window_view(values, len(weights)) @ weights
+    return out
+
+
+def windowed_ema(values, span:int, window:int):
+
+    '''
+    EMA of each trailing window, seeded at the first bar of that window.
+
+    Matches what a per-bar strategy gets from hist_data['close'].ewm(span=span, adjust=False).mean()[-1]
+    when it is handed a slice of `window` bars.
+    '''
+
+    return _apply_window(values, _ewm_weights(span, window))
+
+
+def windowed_macd(values, fast:int, slow:int, signal:int, window:int):
+
+    '''
+    MACD and signal line of each trailing window, seeded at the first bar of that window.
+
+    Every value is a linear combination of the window's closes, so the weights are built once and applied
+    to all windows in a single matrix product.
+    '''
+
+    # Row m holds the weights of the macd line at position m of the window:
+    macd_matrix = np.array([_pad_back(_ewm_weights(fast, m + 1) - _ewm_weights(slow, m + 1), window)
+                            for m in range(window)])
+    macd_weights = macd_matrix[-1]
+    signal_weights = _ewm_weights(signal, window) @ macd_matrix
+    return _apply_window(values, macd_weights), _apply_window(values, signal_weights)
+
+
+def window_features(df, columns:list, window:int, normalize:bool=False):
+
+    '''
+    Every trailing window of the columns as one float32 array of shape (bars - window + 1, window, columns),
+    built from a single sliding_window_view. Row k holds bars k to k + window - 1. With normalize, each
+    column is scaled to its first value in the window (x / x[0] - 1), as the CNN models were trained.
+    '''
+
+    values = df[columns].to_numpy(dtype='float64')
+    windows = sliding_window_view(values, window, axis=0).transpose(0, 2, 1)
+    if normalize:
+        windows = windows / windows[:, :1, :] - 1
+    return windows.astype('float32')
+
+
+class Indicator:
+
+    '''
+    Base class for the streaming indicators.
+
+    Each indicator is fed one bar at a time and keeps its own state, so an update costs the same no matter
+    how much history came before it. value is NaN until the indicator has seen enough bars (see ready).
+    '''
+
+    source = 'close'
+
+    def __init__(self):
+        self.value = math.nan
+        self.count = 0
+
+    @property
+    def ready(self):
+        return not math.isnan(self.value)
+
+    def update(self, value:float):
+        raise NotImplementedError
+
+    def update_bar(self, open:float, high:float, low:float, close:float, volume:float=0):
+
+        '''Feed a full OHLCV bar. By default only the indicator's source column is used.'''
+
+        return self.update(dict(open=open, high=high, low=low, close=close, volume=volume)[self.source])
+
+
+class EMA(Indicator):
+
+    '''Exponential moving average. Seeded with the first value, like ewm(span=period, adjust=False).'''
+
+    def __init__(self, period:int, source='close'):
+        super().__init__()
+        self.period = period
+        self.source = source
+        self.alpha = 2 / (period + 1)
+
+    def update(self, value:float):
+        self.count += 1
+        self.value = value if self.count == 1 else self.value + self.alpha * (value - self.value)
+        return self.value
+
+
+class MACD(Indicator):
+
+    '''MACD line (fast EMA - slow EMA), its signal line and the histogram between them.'''
+
+    def __init__(self, fast:int=12, slow:int=26, signal:int=9, source='close'):
+        super().__init__()
+        self.source = source
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal_ema = EMA(signal)
+
+    @property
+    def signal(self):
+        return self.signal_ema.value
+
+    @property
+    def histogram(self):
+        return self.value - self.signal_ema.value
+
+    def update(self, value:float):
+        self.count += 1
+        self.value = self.fast.update(value) - self.slow.update(value)
+        self.signal_ema.update(self.value)
+        return self.value
+
+
+class SMA(Indicator):
+
+    '''Simple moving average kept as a running sum over the last period values.'''
+
+    def __init__(self, period:int, source='close'):
+        super().__init__()
+        self.period = period
+        self.source = source
+        self.values = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, value:float):
+        self.count += 1
+        if len(self.values) == self.period:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self.value = self.total / self.period if len(self.values) == self.period else math.nan
+        return self.value
+
+
+class RollingMax(Indicator):
+
+    '''Highest value over the last period values, using a monotonic deque of (index, value) pairs.'''
+
+    def __init__(self, period:int, source='high'):
+        super().__init__()
+        self.period = period
+        self.source = source
+        self.window = deque()
+
+    def _beats(self, new:float, old:float):
+        return new >= old
+
+    def update(self, value:float):
+        self.count += 1
+        while self.window and self._beats(value, self.window[-1][1]):
+            self.window.pop()
+        self.window.append((self.count, value))
+        if self.window[0][0] <= self.count - self.period:
+            self.window.popleft()
+        self.value = self.window[0][1] if self.count >= self.period else math.nan
+        return self.value
+
+
+class RollingMin(RollingMax):
+
+    '''Lowest value over the last period values.'''
+
+    def __init__(self, period:int, source='low'):
+        super().__init__(period, source)
+
+    def _beats(self, new:float, old:float):
+        return new <= old
+
+
+class ATR(Indicator):
+
+    '''Average true range with Wilder's smoothing. The first value is the mean of the first period true ranges.'''
+
+    def __init__(self, period:int=14):
+        super().__init__()
+        self.period = period
+        self.prev_close = None
+        self.total = 0.0
+
+    def update(self, high:float, low:float, close:float):
+        self.count += 1
+        true_range = high - low
+        if self.prev_close is not None:
+            true_range = max(true_range, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        if self.count < self.period:
+            self.total += true_range
+        elif self.count == self.period:
+            self.value = (self.total + true_range) / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + true_range) / self.period
+        return self.value
+
+    def update_bar(self, open:float, high:float, low:float, close:float, volume:float=0):
+        return self.update(high, low, close)
+
+
+class Precomputed(Indicator):
+
+    '''Serves a value computed ahead of time for every bar, such as a batched model prediction.'''
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = values
+
+    def update_bar(self, open:float, high:float, low:float, close:float, volume:float=0):
+        self.value = self.values[self.count]
+        self.count += 1
+        return self.value
+
+
+def warm_up(indicators:dict, df):
+
+    '''Feed every bar of an OHLCV DataFrame to each indicator, oldest first.'''
+
+    volume = df['volume'] if 'volume' in df.columns else [0] * len(df)
+    for bar in zip(df['open'], df['high'], df['low'], df['close'], volume):
+        for indicator in indicators.values():
+            indicator.update_bar(*bar)
+    return indicators
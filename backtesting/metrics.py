@@ -0,0 +1,106 @@
+# Third party imports:
+import numpy as np
+
+# Constants:
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60  # Crypto trades around the clock
+
+
+def periods_per_year(timestamps):
+
+    '''Bars per year, from the median spacing of a DatetimeIndex.'''
+
+    if len(timestamps) < 2:
+        return np.nan
+    seconds = np.median(np.diff(timestamps.values.astype('datetime64[s]').astype('int64')))
+    return SECONDS_PER_YEAR / seconds
+
+
+def evaluated_curves(backtest):
+
+    '''
+    The per-bar curves run_backcast recorded, cut to the bars it evaluated. Returns (timestamps, equity,
+    position) with position as the fraction of equity invested.
+    '''
+
+    curves = backtest.curves
+    evaluated = ~np.isnan(curves['equity'])
+    equity = curves['equity'][evaluated]
+    close = backtest.backcast_data['close'].to_numpy(dtype='float64')[evaluated]
+    return backtest.backcast_data.index[evaluated], equity, curves['position'][evaluated] * close / equity
+
+
+def drawdown(equity):
+
+    '''Drawdown from the running peak at every bar, as a (negative) fraction.'''
+
+    return equity / np.maximum.accumulate(equity) - 1
+
+
+def max_drawdown_duration(equity):
+
+    '''Longest stretch of bars spent below a previous peak.'''
+
+    bars = np.arange(len(equity))
+    last_peak = np.maximum.accumulate(np.where(equity >= np.maximum.accumulate(equity), bars, 0))
+    return int((bars - last_peak).max()) if len(equity) else 0
+
+
+def sharpe_ratio(returns, periods:float):
+    std = returns.std()
+    return returns.mean() / std * np.sqrt(periods) if std > 0 else np.nan
+
+
+def sortino_ratio(returns, periods:float):
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    return returns.mean() / downside * np.sqrt(periods) if downside > 0 else np.nan
+
+
+def profit_factor(trade_returns):
+
+    '''Gross profit over gross loss of the trades' percent changes.'''
+
+    losses = -trade_returns[trade_returns < 0].sum()
+    return trade_returns[trade_returns > 0].sum() / losses if losses > 0 else np.nan
+
+
+def compute_metrics(equity, position, periods:float, trade_returns=None):
+
+    '''
+    Risk and return metrics of a per-bar equity curve. position is the fraction of equity invested at each
+    bar and periods the number of bars per year. Every metric is a handful of array passes, so a 1M bar
+    run takes milliseconds.
+
+        sharpe, sortino   - annualized, from bar-to-bar returns, zero risk free rate
+        calmar            - annualized return over the max drawdown
+        exposure          - share of bars with a position open
+        turnover          - equity traded per year, as a multiple of equity (two per round trip when all in)
+        profit_factor     - gross profit over gross loss of trade_returns, if given
+    '''
+
+    equity = np.asarray(equity, dtype='float64')
+    position = np.asarray(position, dtype='float64')
+    returns = np.diff(equity) / equity[:-1]
+    years = len(returns) / periods if len(returns) else np.nan
+    total_return = equity[-1] / equity[0] - 1
+    annual_return = (1 + total_return) ** (1 / years) - 1 if years and total_return > -1 else np.nan
+    max_drawdown = drawdown(equity).min()
+    turnover = np.abs(np.diff(position, prepend=0)).sum() / years if years else np.nan
+    return dict(total_return=total_return,
+                annual_return=annual_return,
+                sharpe=sharpe_ratio(returns, periods),
+                sortino=sortino_ratio(returns, periods),
+                calmar=annual_return / -max_drawdown if max_drawdown < 0 else np.nan,
+                max_drawdown=max_drawdown,
+                max_drawdown_duration=max_drawdown_duration(equity),
+                exposure=np.count_nonzero(position) / len(position),
+                turnover=turnover,
+                profit_factor=profit_factor(np.asarray(trade_returns)) if trade_returns is not None else np.nan)
+
+
+def backtest_metrics(backtest):
+
+    '''compute_metrics for a finished BackcastStrategy.'''
+
+    timestamps, equity, position = evaluated_curves(backtest)
+    trade_returns = backtest.trades['pct_change'].to_numpy() if len(backtest.trades) else np.empty(0)
+    return compute_metrics(equity, position, periods_per_year(timestamps), trade_returns)
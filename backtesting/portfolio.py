@@ -0,0 +1,193 @@
+# Standard imports:
+import os
+from datetime import datetime
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Local application imports:
+from backtester import Trade, load_strategy_file, build_backtest
+
+
+def align_bars(frames:dict, columns=('open', 'high', 'low', 'close')):
+
+    '''
+    Aligns the bars of several symbols on the union of their timestamps.
+
+    Returns the shared DatetimeIndex and a dict of (timesteps, symbols) arrays, one per column, with NaN
+    where a symbol has no bar.
+    '''
+
+    index = pd.DatetimeIndex(sorted(set().union(*[df.index for df in frames.values()])))
+    arrays = {col: np.column_stack([df[col].reindex(index).to_numpy(dtype='float64') for df in frames.values()])
+              for col in columns}
+    return index, arrays
+
+
+class PortfolioBacktest:
+
+    '''
+    Runs one signals(df) strategy over many symbols on a shared timeline.
+
+    The bars of all symbols are aligned into 2-D arrays and every timestep is a handful of array operations
+    across the symbols: stop losses, take profits and sell signals close positions (in that order, as in
+    BackcastStrategy), then buy signals open new ones under the allocation policy:
+
+        equal_weight   - each position gets equity / max_positions
+        fixed_fraction - each position gets position_fraction * equity
+
+    max_positions caps the number of open positions (all symbols by default). Entries are limited by the
+    cash on hand and taken in symbol order. As in run_backcast, the last bar is not evaluated and open
+    positions are closed at the close of the bar before it.
+    '''
+
+    def __init__(self, strategy, starting_capital:float, periods_needed:int, stop_loss=None, take_profit=None,
+                 allocation:str='equal_weight', max_positions:int=None, position_fraction:float=0.1):
+        if allocation not in ('equal_weight', 'fixed_fraction'):
+            raise ValueError(f"Unknown allocation '{allocation}'. Use 'equal_weight' or 'fixed_fraction'.")
+        if not strategy.signals_func:
+            raise ValueError('Portfolio backtests need a config that defines signals(df).')
+        self.strategy = strategy
+        self.starting_capital = starting_capital
+        self.capital = starting_capital
+        self.periods_needed = periods_needed
+        self.stop_loss = stop_loss if stop_loss else None
+        self.take_profit = take_profit if take_profit else None
+        self.allocation = allocation
+        self.max_positions = max_positions
+        self.position_fraction = position_fraction
+        self.symbols = []
+        self.index = None
+        self.equity = None
+        self.trades = None
+
+    def _signal_arrays(self, frames:dict):
+
+        '''buy and sell masks on the shared timeline. Bars without a full window of their own are ignored.'''
+
+        buy = np.zeros((len(self.index), len(frames)), dtype=bool)
+        sell = np.zeros_like(buy)
+        for j, df in enumerate(frames.values()):
+            signals = np.asarray(self.strategy.signals_func(df))
+            signals[:self.periods_needed - 1] = 'pass'
+            rows = self.index.get_indexer(df.index)
+            buy[rows, j] = signals == 'buy'
+            sell[rows, j] = signals == 'sell'
+        return buy, sell
+
+    def run(self, frames:dict):
+
+        self.symbols = list(frames)
+        self.index, bars = align_bars(frames)
+        close, low = bars['close'], bars['low']
+        buy, sell = self._signal_arrays(frames)
+        n_steps, n_symbols = close.shape
+        max_positions = self.max_positions or n_symbols
+
+        # Position state, one entry per symbol:
+        qty = np.zeros(n_symbols)
+        entry_price = np.full(n_symbols, np.nan)
+        stop_price = np.full(n_symbols, -np.inf)
+        take_profit_price = np.full(n_symbols, np.inf)
+        period_count = np.zeros(n_symbols, dtype=int)
+        highest_gain = np.zeros(n_symbols)
+        max_drawdown = np.zeros(n_symbols)
+        open_trades = [None] * n_symbols
+
+        last_close = np.full(n_symbols, np.nan)  # For valuing positions of symbols without a bar this step
+        cash = self.starting_capital
+        self.equity = np.full(n_steps, np.nan)
+        trades = []
+
+        def close_position(j, t, exit_price, stop_loss=0, take_profit=0):
+            trade = open_trades[j]
+            trade.period_count, trade.highest_gain, trade.max_drawdown = period_count[j], highest_gain[j], max_drawdown[j]
+            trades.append(dict(symbol=self.symbols[j], **trade.log_sell(self.index[t], exit_price, cash, stop_loss, take_profit)))
+            open_trades[j] = None
+            qty[j] = 0
+
+        last_step = n_steps - 2
+        for t in range(last_step + 1):
+            price = close[t]
+            has_bar = ~np.isnan(price)
+            last_close = np.where(has_bar, price, last_close)
+            holding = (qty > 0) & has_bar
+
+            # Exits:
+            stop_hit = holding & (low[t] <= stop_price)
+            take_profit_hit = holding & ~stop_hit & (price >= take_profit_price)
+            exiting = stop_hit | take_profit_hit | (holding & sell[t])
+            exit_price = np.where(stop_hit, stop_price, np.where(take_profit_hit, take_profit_price, price))
+
+            # Bars held without an exit update the trade statistics, like Trade.log_pass:
+            passing = holding & ~exiting
+            pct_change = np.where(passing, (price - entry_price) / entry_price, 0)
+            period_count += passing
+            highest_gain = np.maximum(highest_gain, pct_change)
+            max_drawdown = np.minimum(max_drawdown, pct_change)
+
+            for j in np.flatnonzero(exiting):
+                cash += qty[j] * exit_price[j]
+                close_position(j, t, exit_price[j], int(stop_hit[j]), int(take_profit_hit[j]))
+
+            # Entries, on symbols that were flat at the start of the bar:
+            equity = cash + np.nansum(qty * last_close)
+            candidates = np.flatnonzero(has_bar & buy[t] & ~holding & ~exiting)
+            slots = max_positions - np.count_nonzero(qty)
+            if len(candidates) and slots > 0:
+                candidates = candidates[:slots]
+                size = equity / max_positions if self.allocation == 'equal_weight' else equity * self.position_fraction
+                allocated = np.minimum(size, np.maximum(cash - size * np.arange(len(candidates)), 0))
+                candidates, allocated = candidates[allocated > 0], allocated[allocated > 0]
+                cash -= allocated.sum()
+                qty[candidates] = allocated / price[candidates]
+                entry_price[candidates] = price[candidates]
+                period_count[candidates], highest_gain[candidates], max_drawdown[candidates] = 0, 0, 0
+                stop_price[candidates] = price[candidates] * (1 - self.stop_loss) if self.stop_loss else -np.inf
+                take_profit_price[candidates] = price[candidates] * (1 + self.take_profit) if self.take_profit else np.inf
+                for j in candidates:
+                    open_trades[j] = Trade(self.stop_loss, self.take_profit)
+                    open_trades[j].log_buy(self.index[t], price[j])
+
+            self.equity[t] = cash + np.nansum(qty * last_close)
+
+        # Close positions at the end of the backcast:
+        for j in np.flatnonzero(qty > 0):
+            cash += qty[j] * last_close[j]
+            close_position(j, last_step, last_close[j])
+
+        self.capital = cash
+        self.trades = pd.DataFrame(trades)
+        return self.trades
+
+
+def run_portfolio(args):
+
+    '''Loads the config's bars for every symbol in --symbols and runs them as one portfolio.'''
+
+    strategy_file = load_strategy_file(args.strategy_config_file)
+    config = strategy_file.strategy_config
+    if args.source:
+        config['source'] = args.source
+
+    frames = dict()
+    for symbol in args.symbols.split(','):
+        config['crypto_sym'] = symbol
+        frames[symbol] = build_backtest(strategy_file).load_data(use_bar_store=not args.no_bar_store)
+
+    backtest = build_backtest(strategy_file)
+    portfolio = PortfolioBacktest(backtest.strategy, config['starting_capital'], config['periods_needed'],
+                                  stop_loss=config.get('stop_loss'), take_profit=config.get('take_profit'),
+                                  allocation=args.allocation or config.get('allocation', 'equal_weight'),
+                                  max_positions=args.max_positions or config.get('max_positions'),
+                                  position_fraction=args.position_fraction or config.get('position_fraction', 0.1))
+    trades = portfolio.run(frames)
+
+    os.makedirs('backtest_summaries', exist_ok=True)
+    fname = f"{config['name']}_{datetime.now().strftime('%Y-%m-%d_%H%M')}_portfolio"
+    trades.to_csv(f'backtest_summaries/{fname}_trades.csv', index=False)
+    print(f"{len(portfolio.symbols)} symbols, {len(trades)} trades. "
+          f"Ending capital ${portfolio.capital:.2f} ({(portfolio.capital / portfolio.starting_capital - 1):.2%})")
+    print(f'Portfolio Backtest Complete. Trades saved to backtest_summaries/{fname}_trades.csv')
+    return portfolio
@@ -0,0 +1,71 @@
+# Standard imports:
+import os
+import json
+import hashlib
+
+# Third party imports:
+import numpy as np
+
+# Models loaded so far, by path. TensorFlow is only imported the first time one is needed:
+_models = dict()
+_file_hashes = dict()
+
+
+def load_model(path:str):
+
+    '''Load a Keras model on first use, so importing a config file does not pay TensorFlow's startup cost.'''
+
+    if path not in _models:
+        from tensorflow.keras.models import load_model as keras_load_model
+        _models[path] = keras_load_model(path)
+    return _models[path]
+
+
+def file_hash(path:str):
+
+    '''sha256 of a file's content, remembered per (path, size, mtime).'''
+
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
+class PredictionCache:
+
+    '''
+    Model predictions saved as .npy files, keyed by the model file's content hash, the feature spec and
+    the bar range they were computed on. A rerun or sweep that only changes exit parameters reads the
+    stored predictions and never loads the model.
+    '''
+
+    def __init__(self, root:str='prediction_cache'):
+        self.root = root
+
+    @staticmethod
+    def key(model_path:str, feature_spec:dict, index):
+        description = json.dumps(dict(model=file_hash(model_path),
+                                      features=feature_spec,
+                                      start=str(index[0]),
+                                      end=str(index[-1]),
+                                      bars=len(index)), sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key:str):
+        return os.path.join(self.root, f'{key}.npy')
+
+    def get(self, key:str):
+        path = self._path(key)
+        return np.load(path) if os.path.exists(path) else None
+
+    def put(self, key:str, predictions):
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = self._path(key) + f'.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.save(f, predictions)
+        os.replace(temp_path, self._path(key))  # Atomic, so parallel sweep workers never read half a file
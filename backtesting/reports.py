@@ -0,0 +1,252 @@
+# Standard imports:
+import io
+import os
+import json
+import html
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Local application imports:
+from benchmarks import comparison_curves
+from downsample import lttb
+
+# Constants:
+REPORT_FORMATS = ['xlsx', 'html', 'json']
+MAX_POINTS = 2000  # Points per series in html and json reports
+MAX_PLOT_POINTS = 3000  # About one point per pixel of the 30 inch wide plots
+MAX_ANNOTATED_TRADES = 100  # Beyond this the trades plot only draws markers
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
+
+
+def report_payload(backtest):
+
+    '''
+    Everything a report needs from a finished backtest, as plain arrays and frames so it can be pickled
+    to a worker process. Benchmarks are read here, in the process that owns the bar store.
+    '''
+
+    df = backtest.backcast_data
+    return dict(name=f'{backtest.strategy_name}_{backtest.datestamp}',
+                summary=backtest.build_summary_report(),
+                trades=pd.DataFrame(backtest.trades),
+                timestamps=df.index.values.astype('datetime64[s]').astype('int64'),
+                close=df['close'].to_numpy(dtype='float64'),
+                curves=comparison_curves(backtest, backtest.benchmarks))
+
+
+def trade_positions(payload):
+
+    '''Bar positions of every trade entry and exit, which downsampling must keep.'''
+
+    trades = payload['trades']
+    if not len(trades):
+        return np.empty(0, dtype=int)
+    times = np.r_[trades['trade_start'].values, trades['trade_end'].values].astype('datetime64[s]').astype('int64')
+    return np.searchsorted(payload['timestamps'], times)
+
+
+def render_trades_plot(payload):
+
+    '''Close price with buy and sell markers, as PNG bytes in a buffer.'''
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    trades = payload['trades']
+    keep = lttb(payload['close'], MAX_PLOT_POINTS, keep=trade_positions(payload))
+    index = pd.to_datetime(payload['timestamps'][keep], unit='s')
+    plt.style.use('seaborn-whitegrid')
+    fig = plt.figure(figsize=(30, 8))
+    plt.plot(index, payload['close'][keep], lw=2)
+    plt.xticks([])
+    if len(trades):
+        plt.scatter(trades['trade_start'], trades['buy_price'], marker='^', s=70, color='green')
+        plt.scatter(trades['trade_end'], trades['sell_price'], marker='v', s=70, color='red')
+    if len(trades) <= MAX_ANNOTATED_TRADES:
+        for i in range(len(trades)):
+            plt.annotate(i, (trades['trade_start'][i], trades['buy_price'][i]), xytext=(-10, -10),
+                         textcoords='offset points', fontsize=14, fontweight='bold')
+            plt.annotate(i, (trades['trade_end'][i], trades['sell_price'][i]), xytext=(-10, -10),
+                         textcoords='offset points', fontsize=14, fontweight='bold')
+    sns.despine()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    buffer.seek(0)
+    return buffer
+
+
+def render_comparison_chart(payload):
+
+    '''Strategy equity against buy and hold and the benchmarks, as PNG bytes in a buffer.'''
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    index = pd.to_datetime(payload['timestamps'], unit='s')
+    trades = trade_positions(payload)
+    plt.style.use('seaborn-whitegrid')
+    fig = plt.figure(figsize=(30, 8))
+    for name, values in payload['curves'].items():
+        keep = lttb(values, MAX_PLOT_POINTS, keep=trades)
+        plt.plot(index[keep], values[keep], label=name)
+    plt.legend()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    buffer.seek(0)
+    return buffer
+
+
+def write_xlsx(payload, path:str):
+
+    '''The Excel report: summary and trades tabs, and both plots embedded from memory.'''
+
+    writer = pd.ExcelWriter(path, engine='xlsxwriter')
+    payload['summary'].to_excel(writer, sheet_name='Backtest Summary', index=False, header=False)
+
+    df_trades = payload['trades'].copy()
+    if len(df_trades):
+        df_trades['time_held'] = [str(x) for x in df_trades['time_held']]
+    df_trades.to_excel(writer, sheet_name='Trades')
+
+    writer.book.add_worksheet(name='Trades Plot').insert_image('C2', 'trades.png', {'image_data': render_trades_plot(payload)})
+    writer.book.add_worksheet(name='Comparison Plot').insert_image('C2', 'compare.png', {'image_data': render_comparison_chart(payload)})
+    writer.close()
+
+
+def _series(payload, max_points:int=MAX_POINTS):
+
+    '''
+    Close and comparison curves on one downsampled timeline, picked by LTTB on the close plus every trade's
+    entry and exit bar, with None for missing values so they serialize to JSON.
+    '''
+
+    keep = lttb(payload['close'], max_points, keep=trade_positions(payload))
+    series = dict(timestamp=pd.to_datetime(payload['timestamps'][keep], unit='s').strftime('%Y-%m-%dT%H:%M:%S').tolist(),
+                  close=payload['close'][keep])
+    series.update({name: values[keep] for name, values in payload['curves'].items()})
+    return {key: values if key == 'timestamp' else [None if np.isnan(v) else float(v) for v in values]
+            for key, values in series.items()}
+
+
+def _report_dict(payload):
+    trades = payload['trades'].copy()
+    for col in trades.columns:
+        if col in ('trade_start', 'trade_end', 'time_held'):
+            trades[col] = trades[col].astype(str)
+    return dict(name=payload['name'],
+                summary=dict(zip(payload['summary'][0].astype(str), payload['summary'][1].astype(str))),
+                trades=json.loads(trades.to_json(orient='records')),
+                series=_series(payload))
+
+
+def write_json(payload, path:str):
+    with open(path, 'w') as f:
+        json.dump(_report_dict(payload), f)
+
+
+def _svg_chart(series:dict, names, width:int=1200, height:int=300, markers=()):
+
+    '''Inline SVG line chart of the named series against their position, with optional (x, y, color) markers.'''
+
+    values = np.array([[np.nan if v is None else v for v in series[name]] for name in names], dtype='float64')
+    low, high = np.nanmin(values), np.nanmax(values)
+    span = (high - low) or 1
+    n = max(values.shape[1] - 1, 1)
+
+    def point(x, y):
+        return f'{x / n * width:.1f},{height - (y - low) / span * height:.1f}'
+
+    lines = []
+    for k, (name, row) in enumerate(zip(names, values)):
+        points = ' '.join(point(x, y) for x, y in enumerate(row) if not np.isnan(y))
+        color = COLORS[k % len(COLORS)]
+        lines.append(f'<polyline fill="none" stroke="{color}" stroke-width="1.5" points="{points}"/>')
+        lines.append(f'<text x="{10 + 140 * k}" y="14" fill="{color}" font-size="12">{html.escape(name)}</text>')
+    for x, y, color in markers:
+        cx, cy = point(x, y).split(',')
+        lines.append(f'<circle cx="{cx}" cy="{cy}" r="3" fill="{color}"/>')
+    return f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}">{"".join(lines)}</svg>'
+
+
+def write_html(payload, path:str):
+
+    '''
+    A single self-contained HTML page: the summary and trades tables, SVG charts drawn from the downsampled
+    series, and the series themselves as embedded JSON. Needs no plotting library.
+    '''
+
+    report = _report_dict(payload)
+    series = report['series']
+
+    # Trade markers on the downsampled timeline, which keeps every entry and exit bar:
+    positions = pd.to_datetime(pd.Series(series['timestamp'])).values
+    trades = payload['trades']
+    markers = []
+    if len(trades):
+        for col, price, color in [('trade_start', 'buy_price', 'green'), ('trade_end', 'sell_price', 'red')]:
+            xs = np.minimum(np.searchsorted(positions, trades[col].values), len(positions) - 1)
+            markers += list(zip(xs, trades[price], [color] * len(trades)))
+
+    body = [f'<h1>{html.escape(payload["name"])}</h1>',
+            payload['summary'].to_html(index=False, header=False),
+            '<h2>Trades</h2>', _svg_chart(series, ['close'], markers=markers),
+            '<h2>Comparison</h2>', _svg_chart(series, list(payload['curves'])),
+            '<h2>Trade Log</h2>', trades.to_html(),
+            f'<script type="application/json" id="series">{json.dumps(series)}</script>']
+    with open(path, 'w') as f:
+        f.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(payload["name"])}</title></head>'
+                f'<body style="font-family: sans-serif">{"".join(body)}</body></html>')
+
+
+def write_report(payload, fmt:str='xlsx', directory:str='backtest_summaries'):
+
+    '''Writes one report and returns its path. Runs in the report pool's workers or inline.'''
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{payload['name']}.{fmt}")
+    dict(xlsx=write_xlsx, html=write_html, json=write_json)[fmt](payload, path)
+    return path
+
+
+class ReportPool:
+
+    '''
+    Renders reports on background processes. submit() returns as soon as the payload is built, so the
+    engine can move on to the next run while matplotlib and xlsxwriter work elsewhere.
+
+        with ReportPool(workers=4) as reports:
+            for backtest in ...:
+                backtest.run_backcast()
+                reports.submit(backtest, 'html')
+        paths = reports.paths
+    '''
+
+    def __init__(self, workers:int=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.futures = []
+        self.paths = []
+
+    def submit(self, backtest, fmt:str='xlsx'):
+        future = self.executor.submit(write_report, report_payload(backtest), fmt)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        self.paths = [future.result() for future in self.futures]
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.wait()
+        self.executor.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
@@ -0,0 +1,148 @@
+# Standard imports:
+import os
+import json
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Local application imports:
+from backtester import load_strategy_file, build_backtest
+from metrics import backtest_metrics
+from reports import ReportPool
+
+# Worker state, set once per process by _init_worker so the bar data is not pickled with every task:
+_strategy_file = None
+_backcast_data = None
+_vectorized = True
+
+
+def grid_samples(space:dict):
+
+    '''Every combination of the listed values.'''
+
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[key] for key in keys])]
+
+
+def _scale(space:dict, unit_samples):
+
+    '''Maps samples in [0, 1) onto the [low, high] bounds of each parameter. Integer bounds give integers.'''
+
+    samples = []
+    for row in unit_samples:
+        sample = dict()
+        for (key, (low, high)), u in zip(space.items(), row):
+            if isinstance(low, int) and isinstance(high, int):
+                sample[key] = int(low + np.floor(u * (high - low + 1)))
+            else:
+                sample[key] = float(low + u * (high - low))
+        samples.append(sample)
+    return samples
+
+
+def random_samples(space:dict, n:int, seed:int=0):
+    rng = np.random.default_rng(seed)
+    return _scale(space, rng.random((n, len(space))))
+
+
+def lhs_samples(space:dict, n:int, seed:int=0):
+
+    '''Latin hypercube: each parameter's range is cut into n strata and every stratum is sampled once.'''
+
+    rng = np.random.default_rng(seed)
+    strata = np.column_stack([rng.permutation(n) for _ in space])
+    return _scale(space, (strata + rng.random((n, len(space)))) / n)
+
+
+def apply_params(strategy_file, params:dict):
+
+    '''Sets strategy parameters in the config's params dict and everything else in strategy_config.'''
+
+    for key, value in params.items():
+        if key in getattr(strategy_file, 'params', dict()):
+            strategy_file.params[key] = value
+        else:
+            strategy_file.strategy_config[key] = value
+
+
+def summarize(backtest):
+
+    '''Headline numbers and risk metrics of a finished backtest, without building any report.'''
+
+    trades = backtest.trades
+    metrics = backtest_metrics(backtest)
+    metrics.pop('total_return')  # Same as pct_return
+    return dict(ending_capital=backtest.capital,
+                pct_return=(backtest.capital - backtest.starting_capital) / backtest.starting_capital,
+                trades=len(trades),
+                win_ratio=(trades['pct_change'] > 0).mean() if len(trades) else np.nan,
+                **metrics)
+
+
+def _init_worker(strategy_config_file:str, backcast_data, vectorized:bool):
+    global _strategy_file, _backcast_data, _vectorized
+    _strategy_file = load_strategy_file(strategy_config_file)
+    _backcast_data = backcast_data
+    _vectorized = vectorized
+
+
+def _run_one(params:dict):
+    apply_params(_strategy_file, params)
+    backtest = build_backtest(_strategy_file)
+    backtest.backcast_data = _backcast_data
+    backtest.run_backcast(vectorized=_vectorized)
+    return dict(params, **summarize(backtest))
+
+
+def run_sweep(args):
+
+    '''
+    Runs one config over many parameter sets on a process pool and writes a results table ranked by
+    return and then drawdown. Only the top_k runs get a report, rendered on a background pool.
+    '''
+
+    space = json.loads(args.sweep)
+    if args.sweep_method == 'grid':
+        samples = grid_samples(space)
+    elif args.sweep_method == 'random':
+        samples = random_samples(space, args.samples, args.seed)
+    else:
+        samples = lhs_samples(space, args.samples, args.seed)
+
+    # Load the bars once in the parent process:
+    strategy_file = load_strategy_file(args.strategy_config_file)
+    if args.source:
+        strategy_file.strategy_config['source'] = args.source
+    backtest = build_backtest(strategy_file)
+    backcast_data = backtest.load_data(use_bar_store=not args.no_bar_store)
+    if backtest.strategy.predict_func:
+        # Fill the prediction cache once so the workers never load the model:
+        backtest.precompute_predictions()
+    print(f'Sweeping {len(samples)} parameter sets over {len(backcast_data)} bars...')
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.strategy_config_file, backcast_data, not args.per_bar)) as pool:
+        results = list(pool.map(_run_one, samples, chunksize=max(1, len(samples) // (8 * (args.workers or os.cpu_count())))))
+
+    df = pd.DataFrame(results).sort_values(['pct_return', 'max_drawdown'], ascending=False).reset_index(drop=True)
+    os.makedirs('backtest_summaries', exist_ok=True)
+    fname = f"{strategy_file.strategy_config['name']}_{datetime.now().strftime('%Y-%m-%d_%H%M')}_sweep"
+    df.to_csv(f'backtest_summaries/{fname}.csv', index=False)
+    print(df.head(10).to_string())
+
+    # Full reports for the best runs only, rendered in the background while the next one runs:
+    with ReportPool(args.workers) as reports:
+        for rank, params in enumerate(df[list(space)].head(0 if args.no_report else args.top_k).to_dict('records')):
+            apply_params(strategy_file, params)
+            backtest = build_backtest(strategy_file)
+            backtest.strategy_name = f'{backtest.strategy_name}_sweep{rank + 1}'
+            backtest.backcast_data = backcast_data.copy()
+            backtest.run_backcast(vectorized=not args.per_bar)
+            reports.submit(backtest, args.report_format)
+
+    print(f'Sweep Complete. Results saved to backtest_summaries/{fname}.csv')
+    return df
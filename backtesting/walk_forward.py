@@ -0,0 +1,136 @@
+# Standard imports:
+import os
+import json
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports:
+import numpy as np
+import pandas as pd
+
+# Local application imports:
+from backtester import load_strategy_file, build_backtest
+from sweep import grid_samples, random_samples, lhs_samples, apply_params, summarize
+from metrics import evaluated_curves
+
+# Worker state, set once per process by _init_worker so the bars are not pickled with every fold:
+_strategy_file = None
+_backcast_data = None
+_predictions = None
+_vectorized = True
+
+
+def make_folds(n_bars:int, train_bars:int, test_bars:int, warmup:int, anchored:bool=False):
+
+    '''
+    Train/test folds as [first, last) row ranges of the backcast data.
+
+    Each test fold follows its train fold and the next fold starts where the last test fold ended. Rolling
+    folds keep train_bars of history, anchored folds train on everything from the first bar. Test ranges
+    start warmup bars early so the strategy's first evaluated bar is the first test bar, and run one bar
+    past the test period because run_backcast never evaluates the last bar.
+    '''
+
+    folds = []
+    test_start = train_bars
+    while test_start < n_bars - 1:
+        test_end = min(test_start + test_bars, n_bars - 1)
+        train_start = 0 if anchored else test_start - train_bars
+        folds.append(dict(train=(train_start, test_start + 1), test=(test_start - warmup, test_end + 1)))
+        test_start = test_end
+    return folds
+
+
+def _init_worker(strategy_config_file:str, backcast_data, predictions, vectorized:bool):
+    global _strategy_file, _backcast_data, _predictions, _vectorized
+    _strategy_file = load_strategy_file(strategy_config_file)
+    _backcast_data = backcast_data
+    _predictions = predictions
+    _vectorized = vectorized
+
+
+def _evaluate(params:dict, rows):
+    apply_params(_strategy_file, params)
+    backtest = build_backtest(_strategy_file)
+    backtest.backcast_data = _backcast_data.iloc[rows[0]:rows[1]]
+    if _predictions is not None:
+        backtest.predictions = _predictions[rows[0]:rows[1]]
+    backtest.run_backcast(vectorized=_vectorized)
+    return backtest, summarize(backtest)
+
+
+def _run_fold(task):
+
+    '''Picks the best parameter set on the fold's train range and runs it on the test range.'''
+
+    fold, samples, objective = task
+    best_params, best_score = None, -np.inf
+    for params in samples:
+        score = _evaluate(params, fold['train'])[1][objective]
+        if best_params is None or score > best_score:
+            best_params, best_score = params, score
+    backtest, test_summary = _evaluate(best_params, fold['test'])
+    timestamps, equity, _ = evaluated_curves(backtest)
+    return best_params, best_score, test_summary, pd.Series(equity, index=timestamps)
+
+
+def run_walk_forward(args):
+
+    '''
+    Walk-forward validation of one config: the --sweep space is searched on every train fold, the best
+    parameters are run on the following test fold, and the test folds are chained into one out-of-sample
+    equity curve, each fold starting from the equity the previous one ended with. Folds run in parallel.
+    '''
+
+    space = json.loads(args.sweep)
+    if args.sweep_method == 'grid':
+        samples = grid_samples(space)
+    elif args.sweep_method == 'random':
+        samples = random_samples(space, args.samples, args.seed)
+    else:
+        samples = lhs_samples(space, args.samples, args.seed)
+
+    # Load the bars, and the model predictions if any, once in the parent process:
+    strategy_file = load_strategy_file(args.strategy_config_file)
+    config = strategy_file.strategy_config
+    if args.source:
+        config['source'] = args.source
+    backtest = build_backtest(strategy_file)
+    backcast_data = backtest.load_data(use_bar_store=not args.no_bar_store)
+    predictions = backtest.precompute_predictions() if backtest.strategy.predict_func else None
+
+    if args.train_bars < config['periods_needed']:
+        raise ValueError(f"--train_bars must be at least periods_needed ({config['periods_needed']}).")
+    folds = make_folds(len(backcast_data), args.train_bars, args.test_bars, config['periods_needed'] - 1, args.anchored)
+    print(f'Walking forward over {len(folds)} folds of {len(backcast_data)} bars, {len(samples)} parameter sets per fold...')
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.strategy_config_file, backcast_data, predictions, not args.per_bar)) as pool:
+        results = list(pool.map(_run_fold, [(fold, samples, args.objective) for fold in folds]))
+
+    # Chain the test folds, scaling each by the equity the previous folds ended with:
+    rows, curves = [], []
+    growth = 1
+    for k, (fold, (params, train_score, test_summary, equity)) in enumerate(zip(folds, results)):
+        curves.append(equity * growth)
+        growth *= test_summary['ending_capital'] / config['starting_capital']
+        rows.append(dict(fold=k + 1,
+                         train_start=backcast_data.index[fold['train'][0]],
+                         train_end=backcast_data.index[fold['train'][1] - 2],
+                         test_start=equity.index[0],
+                         test_end=equity.index[-1],
+                         **params,
+                         **{f'train_{args.objective}': train_score},
+                         **{f'test_{key}': value for key, value in test_summary.items()}))
+    df = pd.DataFrame(rows)
+    equity = pd.concat(curves).rename('equity').to_frame()
+    equity.index.name = 'timestamp'
+
+    os.makedirs('backtest_summaries', exist_ok=True)
+    fname = f"{config['name']}_{datetime.now().strftime('%Y-%m-%d_%H%M')}_walk_forward"
+    df.to_csv(f'backtest_summaries/{fname}.csv', index=False)
+    equity.to_csv(f'backtest_summaries/{fname}_equity.csv')
+    print(df.to_string())
+    print(f"Out-of-sample return {growth - 1:.2%} over {len(equity)} bars.")
+    print(f'Walk-Forward Complete. Results saved to backtest_summaries/{fname}.csv and {fname}_equity.csv')
+    return df, equity
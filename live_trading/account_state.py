@@ -0,0 +1,105 @@
+# Standard imports:
+from logger import logging
+import time
+import threading
+
+# Constants:
+RECONCILE_MINUTES = 15
+
+
+class AccountState:
+
+    '''
+    Cash and positions of a broker account, cached so a trading decision reads its balances without an API call.
+
+    fetch_balances() returns (cash, {symbol: qty}) from one pass over the broker's account endpoints. It is
+    called at startup and then only by reconcile(), on a slow timer (see schedule). In between, every fill the
+    OrderTracker reports is applied as a delta: a buy adds its qty to the position and takes its cost from the
+    cash, a sell does the reverse. Fees are not modelled, the next reconcile corrects them.
+
+    A reconcile that overlaps an order in flight or a fill is discarded, since the broker's snapshot may or may
+    not include that fill, and is retried at the next tick. Resting orders, like a stop loss, don't hold it up:
+    one that fills just as a reconcile reads the broker can be counted twice until the next reconcile.
+
+        account = AccountState(lambda: alpaca_balances(trading_client), orders)
+        account.schedule(runtime)
+    '''
+
+    def __init__(self, fetch_balances, orders=None):
+        self.fetch_balances = fetch_balances
+        self.orders = orders
+        self.cash = 0.0
+        self.positions = dict()
+        self.fills = 0  # Fills applied so far, to spot a reconcile that raced one
+        self.last_reconcile = None  # Unix time
+        self.lock = threading.Lock()
+        if orders is not None:
+            orders.on_fill(self.apply_fill)
+
+    def position(self, symbol:str):
+        return self.positions.get(symbol, 0.0)
+
+    def apply_fill(self, handle, qty:float, notional:float):
+
+        '''OrderTracker fill listener. Orders tracked without a symbol and side are left to the next reconcile.'''
+
+        if handle.symbol is None or handle.side not in ('buy', 'sell'):
+            return
+        sign = 1 if handle.side == 'buy' else -1
+        with self.lock:
+            self.positions[handle.symbol] = self.positions.get(handle.symbol, 0.0) + sign * qty
+            self.cash -= sign * notional
+            self.fills += 1
+
+    def _orders_in_flight(self):
+        return self.orders is not None and any(not handle.resting for handle in list(self.orders.pending.values()))
+
+    def reconcile(self, force:bool=False):
+
+        '''
+        Replaces the cache with the broker's balances and logs any drift. Returns False if it was skipped
+        because orders were in flight, unless force.
+        '''
+
+        if not force and self._orders_in_flight():
+            logging.info('Orders in flight. Deferring the balance reconcile.')
+            return False
+        fills = self.fills
+        cash, positions = self.fetch_balances()
+        positions = {symbol: float(qty) for symbol, qty in positions.items() if float(qty)}
+        with self.lock:
+            if not force and (self.fills != fills or self._orders_in_flight()):
+                logging.info('Filled during the balance reconcile. Deferring it.')
+                return False
+            drift = {symbol: positions.get(symbol, 0.0) - self.positions.get(symbol, 0.0)
+                     for symbol in set(positions) | set(self.positions)}
+            drift = {symbol: qty for symbol, qty in drift.items() if abs(qty) > 1e-9}
+            cash_drift = float(cash) - self.cash
+            first = self.last_reconcile is None
+            self.cash, self.positions = float(cash), positions
+            self.last_reconcile = time.time()
+        if not first and (drift or abs(cash_drift) >= 0.01):
+            logging.info(f'Reconciled balances: cash {cash_drift:+.2f}, positions {drift}')
+        return True
+
+    def schedule(self, runtime, minutes:int=RECONCILE_MINUTES, delay:float=30):
+
+        '''Reconciles every minutes on a BotRuntime, delay seconds after the candle closes the bots trade on.'''
+
+        return runtime.every_bar(minutes, self.reconcile, delay=delay, name='reconcile balances')
+
+
+def alpaca_balances(trading_client):
+
+    '''Cash and positions keyed by symbol without the slash, e.g. ETHUSD, from an alpaca-py TradingClient.'''
+
+    cash = float(trading_client.get_account().cash)
+    return cash, {position.symbol.replace('/', ''): float(position.qty) for position in trading_client.get_all_positions()}
+
+
+def kraken_balances(api, currency:str):
+
+    '''Cash in currency and every other asset, e.g. XETH, from one pykrakenapi get_account_balance call.'''
+
+    volume = api.get_account_balance().iloc[:, 0]
+    return float(volume.get(currency, 0)), {asset: float(qty) for asset, qty in volume.items() if asset != currency}
@@ -0,0 +1,237 @@
+# Standard imports:
+from logger import logging
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+
+# Constants:
+FILLED = {'filled', 'closed'}  # Alpaca, Kraken
+FINISHED = FILLED | {'canceled', 'cancelled', 'expired', 'rejected', 'done_for_day', 'replaced', 'stopped'}
+MIN_SLEEP = 0.05  # Seconds. Shortest wait between passes while orders are pending
+
+
+class OrderHandle:
+
+    '''
+    An order in flight. Resolves to the order's final state, a dict of status, filled_qty and
+    filled_avg_price, once it is filled, canceled, expired or rejected.
+
+    Sync code calls handle.result(); async code awaits the handle, so several orders can be waited
+    on at once with asyncio.gather(*handles).
+    '''
+
+    def __init__(self, order_id:str, deadline:float=None, symbol:str=None, side:str=None, resting:bool=False):
+        self.order_id = order_id
+        self.deadline = deadline  # time.monotonic() at which the tracker cancels the order
+        self.symbol = symbol
+        self.side = side  # 'buy' or 'sell'
+        self.resting = resting  # A stop or take profit that may stay open for days
+        self.state = dict(status='new', filled_qty=0.0, filled_avg_price=None)
+        self.future = Future()
+
+    def done(self):
+        return self.future.done()
+
+    @property
+    def filled(self):
+        return self.state['status'] in FILLED
+
+    def result(self, timeout:float=None):
+        return self.future.result(timeout)
+
+    def add_done_callback(self, callback):
+        self.future.add_done_callback(lambda future: callback(self))
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+
+class OrderTracker:
+
+    '''
+    Follows orders until they finish and resolves their OrderHandles.
+
+    Order updates pushed by the broker (e.g. Alpaca's trade_updates stream) are passed to on_update and
+    resolve handles as soon as they arrive. Pending orders are also polled with fetch_order(order_id), a
+    function returning dict(status, filled_qty, filled_avg_price), as a fallback: every min_interval
+    seconds after an order is placed, backing off by backoff up to max_interval while nothing changes.
+    While updates are streaming in, polling stays at max_interval. All pending orders are polled
+    concurrently, and orders tracked with a timeout are canceled with cancel_order(order_id) when it runs out.
+
+    Functions added with on_fill are called with (handle, qty, notional) for every new fill, partial or
+    final, before the handle resolves, e.g. to keep an AccountState in step with the orders.
+
+    The tracker runs on the caller's event loop when started from async code, or on a background thread.
+    '''
+
+    def __init__(self, fetch_order, cancel_order=None, min_interval:float=0.5, max_interval:float=10,
+                 backoff:float=2, event_timeout:float=60):
+        self.fetch_order = fetch_order
+        self.cancel_order = cancel_order
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.event_timeout = event_timeout  # Seconds after the last pushed update that polling stays relaxed
+        self.pending = dict()
+        self.fill_listeners = []
+        self.lock = threading.Lock()
+        self.last_event = None
+        self.loop = None
+        self.wake = None
+        self.task = None
+
+    def start(self):
+
+        '''Starts polling on the running event loop, or on a daemon thread when called from sync code.'''
+
+        if self.loop is not None:
+            return self
+        self.wake = asyncio.Event()
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.task = self.loop.create_task(self.run())
+        except RuntimeError:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name='order-tracker', daemon=True).start()
+            self.task = asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+        return self
+
+    def _wake(self):
+        if self.loop is not None and self.wake is not None:
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    def on_fill(self, listener):
+
+        '''Adds a listener(handle, qty, notional), called with the quantity and cost of each new fill.'''
+
+        self.fill_listeners.append(listener)
+        return listener
+
+    def track(self, order_id, timeout:float=None, symbol:str=None, side:str=None, resting:bool=False):
+
+        '''
+        Returns a handle for an order that was just submitted, canceled after timeout seconds if unfilled.
+        symbol and side are passed through to the fill listeners. resting marks orders, such as stop losses,
+        that wait for a price level rather than filling right away.
+        '''
+
+        self.start()
+        handle = OrderHandle(str(order_id), time.monotonic() + timeout if timeout else None, symbol, side, resting)
+        with self.lock:
+            self.pending[handle.order_id] = handle
+        self._wake()
+        return handle
+
+    def on_update(self, order_id, status:str, filled_qty:float=None, filled_avg_price:float=None, pushed:bool=True):
+
+        '''Applies an order update, pushed by the broker or polled, and resolves the handle if the order finished.'''
+
+        if pushed:
+            self.last_event = time.monotonic()
+        with self.lock:
+            handle = self.pending.get(str(order_id))
+            if handle is None:
+                return
+            previous = handle.state
+            handle.state = dict(status=status,
+                                filled_qty=float(filled_qty) if filled_qty is not None else previous['filled_qty'],
+                                filled_avg_price=float(filled_avg_price) if filled_avg_price else previous['filled_avg_price'])
+
+            # The new fill since the last update. Average prices are cumulative, so the cost is the difference:
+            qty = handle.state['filled_qty'] - previous['filled_qty']
+            if qty > 0:
+                notional = handle.state['filled_qty'] * (handle.state['filled_avg_price'] or 0) \
+                           - previous['filled_qty'] * (previous['filled_avg_price'] or 0)
+                for listener in self.fill_listeners:
+                    try:
+                        listener(handle, qty, notional)
+                    except Exception:
+                        logging.exception(f'Fill listener failed on order {handle.order_id}.')
+            if status not in FINISHED:
+                return
+            del self.pending[handle.order_id]
+        handle.future.set_result(handle.state)
+
+    async def alpaca_trade_updates(self, data):
+
+        '''Handler for alpaca TradingStream.subscribe_trade_updates.'''
+
+        order = data.order
+        self.on_update(order.id, getattr(order.status, 'value', order.status), order.filled_qty, order.filled_avg_price)
+
+    async def _poll(self, handle:OrderHandle):
+        try:
+            state = await asyncio.to_thread(self.fetch_order, handle.order_id)
+        except Exception as e:
+            logging.warning(f'Could not poll order {handle.order_id}: {e}')
+            return
+        self.on_update(handle.order_id, pushed=False, **state)
+
+    async def _cancel(self, handle:OrderHandle):
+        handle.deadline = None
+        logging.warning(f'Order {handle.order_id} took too long to fill. Canceling order...')
+        try:
+            await asyncio.to_thread(self.cancel_order, handle.order_id)
+        except Exception as e:
+            logging.warning(f'Could not cancel order {handle.order_id}: {e}')  # It may have just filled
+        await self._poll(handle)
+
+    async def run(self):
+        interval = self.min_interval
+        last_poll = -float('inf')
+        while True:
+            with self.lock:
+                handles = list(self.pending.values())
+            now = time.monotonic()
+            expired = [h for h in handles if h.deadline is not None and h.deadline <= now and self.cancel_order]
+            if expired:
+                await asyncio.gather(*[self._cancel(h) for h in expired])
+
+            # Poll everything pending at once, rarely while the broker is pushing updates:
+            streaming = self.last_event is not None and now - self.last_event < self.event_timeout
+            period = self.max_interval if streaming else interval
+            if handles and now - last_poll >= period:
+                await asyncio.gather(*[self._poll(h) for h in handles if not h.done()])
+                last_poll = time.monotonic()
+                interval = min(interval * self.backoff, self.max_interval)
+
+            # Sleep until the next poll, a deadline, or a new order. With nothing pending, only a new order wakes us:
+            self.wake.clear()
+            with self.lock:
+                handles = list(self.pending.values())
+            if not handles:
+                await self.wake.wait()
+                interval = self.min_interval
+                continue
+            now = time.monotonic()
+            deadlines = [h.deadline - now for h in handles if h.deadline is not None]
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=max(min([period - (now - last_poll)] + deadlines), MIN_SLEEP))
+                interval = self.min_interval
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        if self.task is not None:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+def alpaca_order_state(order):
+
+    '''The tracker's view of an alpaca-py Order.'''
+
+    return dict(status=getattr(order.status, 'value', order.status),
+                filled_qty=float(order.filled_qty or 0),
+                filled_avg_price=float(order.filled_avg_price) if order.filled_avg_price else None)
+
+
+def kraken_order_state(con, txid:str):
+
+    '''The tracker's view of a Kraken order, from one QueryOrders call.'''
+
+    response = con.query_private('QueryOrders', {'txid': txid})
+    if response['error']:
+        raise ValueError(response['error'][0])
+    order = response['result'][txid]
+    return dict(status=order['status'], filled_qty=float(order['vol_exec']), filled_avg_price=float(order['price']) or None)
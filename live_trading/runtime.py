@@ -0,0 +1,106 @@
+# Standard imports:
+from logger import logging
+import time
+import asyncio
+import functools
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BarScheduler:
+
+    '''
+    Fire times aligned to candle closes: multiples of the bar length since the unix epoch, as exchanges cut
+    their bars (4 hour bars close at 00:00, 04:00, ... UTC), plus delay seconds for the exchange to
+    publish the closed bar.
+    '''
+
+    def __init__(self, minutes:int, delay:float=2):
+        self.seconds = minutes * 60
+        self.delay = delay
+
+    def next_close(self, now:float=None):
+
+        '''Unix time of the next fire time after now.'''
+
+        now = time.time() if now is None else now
+        return ((now - self.delay) // self.seconds + 1) * self.seconds + self.delay
+
+    async def wait(self):
+
+        '''Sleeps until the next fire time, checking the wall clock so sleeps that overrun don't drift.'''
+
+        fire_at = self.next_close()
+        while True:
+            remaining = fire_at - time.time()
+            if remaining <= 0:
+                return fire_at
+            await asyncio.sleep(min(remaining, 60))
+
+
+class BotRuntime:
+
+    '''
+    One event loop for any number of live bots.
+
+    Jobs registered with every_bar are coroutines fired at every candle close. Blocking SDK calls (krakenex,
+    alpaca-py) are awaited through call(), which runs them on a shared thread pool, so a job can fetch bars,
+    query balances and place orders concurrently and one slow request never holds up the other jobs.
+    A job still running at the next close skips that bar instead of piling up.
+
+        runtime = BotRuntime()
+        runtime.every_bar(240, bot.step, runtime)
+        runtime.run_forever()
+    '''
+
+    def __init__(self, workers:int=8):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-runtime')
+        self.jobs = []
+
+    async def call(self, func, *args, **kwargs):
+
+        '''Awaits a blocking function on the runtime's thread pool.'''
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def every_bar(self, minutes:int, job, *args, delay:float=2, run_now:bool=False, name:str=None):
+
+        '''Runs job(*args), a coroutine function or a plain function, at the close of every bar of minutes.'''
+
+        self.jobs.append(dict(scheduler=BarScheduler(minutes, delay), job=job, args=args, run_now=run_now,
+                              name=name or getattr(job, '__qualname__', repr(job))))
+        return job
+
+    async def _run_job(self, spec:dict):
+        start = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(spec['job']):
+                await spec['job'](*spec['args'])
+            else:
+                await self.call(spec['job'], *spec['args'])
+        except Exception:
+            logging.exception(f"Job {spec['name']} failed.")
+        logging.info(f"Job {spec['name']} finished in {time.monotonic() - start:.1f}s.")
+
+    async def _schedule(self, spec:dict):
+        running = asyncio.create_task(self._run_job(spec)) if spec['run_now'] else None
+        while True:
+            fire_at = await spec['scheduler'].wait()
+            if running is not None and not running.done():
+                logging.warning(f"Job {spec['name']} is still running. Skipping the "
+                                f"{datetime.fromtimestamp(fire_at, tz=timezone.utc):%Y-%m-%d %H:%M} UTC bar.")
+                continue
+            running = asyncio.create_task(self._run_job(spec))
+
+    async def run(self):
+        logging.info(f'Starting {len(self.jobs)} bot jobs...')
+        try:
+            await asyncio.gather(*[self._schedule(spec) for spec in self.jobs])
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_forever(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logging.info('Stopped.')
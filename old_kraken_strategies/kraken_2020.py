@@ -1,7 +1,10 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for live_trading and backtesting (see README)
 import pandas as pd
-import schedule
-import time
 from logger import logging
+from live_trading.runtime import BotRuntime
+from live_trading.order_tracker import OrderTracker, kraken_order_state
 
 import krakenex
 from pykrakenapi import KrakenAPI
@@ -9,15 +12,14 @@ from talib import MACD
 api = krakenex.API()
 k = KrakenAPI(api)
 api.load_key('kraken_keys.py')
+orders = OrderTracker(lambda txid: kraken_order_state(api, txid))
 
 
 def main():
     logging.info('Starting script...')
-    schedule.every(4).hours.do(entry_exit_logic)
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
-    entry_exit_logic()
+    runtime = BotRuntime()
+    runtime.every_bar(240, entry_exit_logic)  # At every candle close, on the runtime's thread pool
+    runtime.run_forever()
 
 def entry_exit_logic():
 
@@ -70,8 +72,7 @@ def entry_exit_logic():
             logging.info('Placed order for {shares} shares at {price}...'.format(shares=shares, price=current_price))
         else:
             logging.info('Trade canceled: {error}'.format(error=buy_order['error']))
-        while len(k.get_open_orders()) > 0:
-                    time.sleep(1)
+        orders.track(buy_order['result']['txid'][0]).result()  # Until it fills or expires
         completed_order = k.get_closed_orders()[0].loc[buy_order['result']['txid'][0]]
         if completed_order['status'] == 'expired':
             logging.info('Trade timed out. Re-calculating metrics and retrying trade.')
@@ -1,7 +1,9 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for live_trading and backtesting (see README)
 import pandas as pd
-import schedule
-import time
 from logger import logging
+from live_trading.runtime import BotRuntime
 
 import krakenex
 from pykrakenapi import KrakenAPI
@@ -13,11 +15,9 @@ api.load_key('kraken_keys.py')
 
 def main():
     logging.info('Starting script...')
-    schedule.every(1).hours.do(entry_exit_logic)
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
-    entry_exit_logic()
+    runtime = BotRuntime()
+    runtime.every_bar(60, entry_exit_logic)  # At every candle close, on the runtime's thread pool
+    runtime.run_forever()
 
 def entry_exit_logic():
 
@@ -1,8 +1,10 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for live_trading and backtesting (see README)
 import pandas as pd
-import schedule
-import time
 from logger import logging
 from tradingbot import Bot
+from live_trading.runtime import BotRuntime
 
 FIAT = 'ZUSD'
 CRYPTO = 'XETH'
@@ -39,31 +41,12 @@ def main():
               interval=INTERVAL,
               strategy=kraken_macdStrategy)
 
-    action = bot.strategy(bot.hist_data, bot.open_position)
-    if action == 'buy':
-        placed_order, completed_order = bot.limit_buy_order()
-        if completed_order['status'] == 'expired':
-            logging.info('Buy order timed out. Re-calculating metrics and retrying trade.')
-            main()
-        else:
-            logging.info('Buy order complete. Placing stop loss order.')
-            bot.stop_loss_order(completed_order, STOP_LOSS_PERCENT)
-    elif action == 'sell':
-        placed_order, completed_order = bot.exit_logic()
-        if completed_order['status'] == 'expired':
-            logging.info('Sell order timed out. Re-calculating metrics and retrying trade.')
-            main()
-        else:
-            logging.info('Sell order complete.')
-    else:
-        logging.info('Holding position')
-        pass
-    logging.info('Check complete.')
+    # Decide at every 4 hour candle close, and once now:
+    runtime = BotRuntime()
+    runtime.every_bar(INTERVAL, bot.step, runtime, STOP_LOSS_PERCENT, run_now=True)
+    bot.account.schedule(runtime)  # Balances are cached. Check them against Kraken every 15 minutes
+    runtime.run_forever()
 
 if __name__ == '__main__':
     logging.info('Starting script...')
-    schedule.every(4).hours.do(main)
-    schedule.run_all()
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    main()
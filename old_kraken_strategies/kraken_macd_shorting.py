@@ -1,7 +1,10 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for live_trading and backtesting (see README)
 import pandas as pd
-import schedule
-import time
 from logger import logging
+from live_trading.runtime import BotRuntime
+from live_trading.order_tracker import OrderTracker, kraken_order_state
 
 import krakenex
 from pykrakenapi import KrakenAPI
@@ -9,6 +12,7 @@ from talib import MACD
 api = krakenex.API()
 k = KrakenAPI(api)
 api.load_key('kraken_keys.py')
+orders = OrderTracker(lambda txid: kraken_order_state(api, txid))
 
 
 def main():
@@ -71,9 +75,8 @@ def exit_logic(pair, open_position, macd_current, signal_current, current_price,
             if (macd_current <= signal_current):
                 type = 'sell'
                 order = api.query_private('AddOrder', {'pair': pair, 'type': type, 'ordertype':'market', 'leverage': str(leverage), 'volume': 0})
-                while len(k.get_open_orders()) > 0:
-                    time.sleep(1)
                 if len(order['error']) == 0:
+                    orders.track(order['result']['txid'][0]).result()  # Until the close fills
                     logging.info('Closed long position.')
                     entry_logic(pair, macd_current, signal_current, current_price, margin_shares)
                 else:
@@ -84,9 +87,8 @@ def exit_logic(pair, open_position, macd_current, signal_current, current_price,
             if (macd_current >= signal_current):
                 type = 'buy'
                 order = api.query_private('AddOrder', {'pair': pair, 'type': type, 'ordertype':'market', 'leverage': str(leverage), 'volume': 0})
-                while len(k.get_open_orders()) > 0:
-                    time.sleep(1)
                 if len(order['error']) == 0:
+                    orders.track(order['result']['txid'][0]).result()  # Until the close fills
                     logging.info('Closed short position')
                     entry_logic(pair, macd_current, signal_current, current_price, margin_shares)
                 else:
@@ -118,7 +120,6 @@ def entry_logic(pair, macd_current, signal_current, current_price, margin_shares
 
 if __name__ == '__main__':
     logging.info('Starting script...')
-    schedule.every(1).hours.do(main)
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    runtime = BotRuntime()
+    runtime.every_bar(60, main)  # At every hourly candle close, on the runtime's thread pool
+    runtime.run_forever()
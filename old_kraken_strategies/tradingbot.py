@@ -1,9 +1,13 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for live_trading and backtesting (see README)
 import pandas as pd
-import schedule
-import time
 from logger import logging
 import krakenex
 from pykrakenapi import KrakenAPI
+from backtesting.indicators import warm_up
+from live_trading.order_tracker import OrderTracker, kraken_order_state
+from live_trading.account_state import AccountState, kraken_balances
 
 class Bot:
 
@@ -31,12 +35,21 @@ class Bot:
     add_strategy()
         adds a strategy function that returns the action of the bot.
 
+    update_indicators()
+        feeds only the bars since the last update to the streaming indicators.
+
+    refresh(runtime)
+        fetches the new bars on a live_trading.runtime.BotRuntime and the balances from the cached account state.
+
+    step(runtime)
+        refreshes, runs the strategy and places its orders. Scheduled at every candle close by the runtime.
+
     calculate_balances()
-        calcuates current balances and volumes of your account.
+        calcuates current balances and volumes of your account from the cached account state.
 
     """
 
-    def __init__(self, kraken_key_filepath, currency, crypto, interval, strategy):
+    def __init__(self, kraken_key_filepath, currency, crypto, interval, strategy, indicators=None):
 
         """
         Parameters
@@ -53,16 +66,27 @@ class Bot:
 
         hist_data : dataframe
             dataframe with OHLCV information
+
+        indicators : dict
+            optional streaming indicators from backtesting/indicators.py, keyed by name.
+            They are fed the history once and then one bar at a time by update_indicators().
         """
 
         self.api, self.con = self.connect_account(kraken_key_filepath)
+        self.orders = OrderTracker(lambda txid: kraken_order_state(self.con, txid),
+                                   lambda txid: self.con.query_private('CancelOrder', {'txid': txid}))
         self.currency = currency
         self.crypto = crypto
         self.interval = interval
         self.strategy = strategy
         self.pair = self.crypto + self.currency
+        self.account = AccountState(lambda: kraken_balances(self.api, self.currency), self.orders)  # Fills applied as they come
+        self.account.reconcile(force=True)
         self.hist_data = self.get_historical_data(self.pair, self.interval)
         self.current_price = self.hist_data.iloc[-1]['close']
+        closed_bars = self.hist_data.iloc[:-1]  # Kraken's last bar is still forming
+        self.last_bar_time = closed_bars.iloc[-1]['time']
+        self.indicators = warm_up(indicators, closed_bars) if indicators else dict()
         self.cash_on_hand, self.crypto_on_hand, self.open_position = self.calculate_balances()
         self.affordable_shares = self.cash_on_hand/self.current_price
 
@@ -88,14 +112,67 @@ class Bot:
         api = KrakenAPI(con)
         return api, con
 
-    def get_historical_data(self, pair:str, interval:int, timezone='US/Central'):
+    def get_historical_data(self, pair:str, interval:int, timezone='US/Central', since=None):
 
-        '''Return OHLCV data for the inputed pair and aggregation'''
+        '''Return OHLCV data for the inputed pair and aggregation. The last bar is still forming.'''
 
-        df = self.api.get_ohlc_data(self.pair, interval=240, ascending=True)[0]
+        df = self.api.get_ohlc_data(pair, interval=interval, since=since, ascending=True)[0]
         df.index = df.index.tz_localize(tz='UTC').tz_convert(timezone)
         return df
 
+    def update_indicators(self):
+
+        '''
+        Fetch only the bars since the last update, feed the ones that closed to the indicators and append them
+        to hist_data, which keeps its length. Its forming bar is replaced by the newest one.
+        '''
+
+        df = self.get_historical_data(self.pair, self.interval, since=self.last_bar_time)
+        self.current_price = df.iloc[-1]['close']
+        self.hist_data = pd.concat([self.hist_data[self.hist_data['time'] < df['time'].iloc[0]], df]).iloc[-len(self.hist_data):]
+        closed_bars = df.iloc[:-1]  # The last bar is still forming. It is fed once it closes
+        new_bars = closed_bars[closed_bars['time'] > self.last_bar_time]
+        if len(new_bars):
+            warm_up(self.indicators, new_bars)
+            self.last_bar_time = new_bars.iloc[-1]['time']
+        return self.indicators
+
+    async def refresh(self, runtime):
+
+        '''Fetch the new bars for hist_data and the indicators, and read the balances from the account state.'''
+
+        await runtime.call(self.update_indicators)
+        self.cash_on_hand, self.crypto_on_hand, self.open_position = self.calculate_balances()
+        self.calculate_affordable_shares()
+
+    async def step(self, runtime, stop_loss_percent=None, retries=3):
+
+        '''
+        One decision: refresh, run the strategy and place its order, retrying orders that expire
+        unfilled up to retries times. A stop loss order follows every filled buy if stop_loss_percent is set.
+        '''
+
+        for attempt in range(retries + 1):
+            await self.refresh(runtime)
+            action = self.strategy(self.hist_data, self.open_position)
+            if action not in ('buy', 'sell'):
+                logging.info('Holding position')
+                return action
+            result = await runtime.call(self.limit_buy_order if action == 'buy' else self.exit_logic)
+            if result is None:
+                return action
+            placed_order, completed_order = result
+            if completed_order['status'] != 'expired':
+                break
+            logging.info(f'{action.capitalize()} order timed out. Re-calculating metrics and retrying trade.')
+        else:
+            return action
+
+        logging.info(f'{action.capitalize()} order complete.')
+        if action == 'buy' and stop_loss_percent:
+            await runtime.call(self.stop_loss_order, completed_order, stop_loss_percent)
+        return action
+
     def check_openPosition(self, crypto_on_hand, crypto_thresh=0.01):
 
         '''Check if there is a current open crypto position.'''
@@ -107,11 +184,10 @@ class Bot:
 
     def calculate_balances(self):
 
-        '''Calculate the current crypto and fiat volume on hand'''
+        '''Calculate the current crypto and fiat volume on hand, from the cache. No API call is made.'''
 
-        volume = self.api.get_account_balance()
-        cash_on_hand = volume.loc[self.currency][0]
-        crypto_on_hand = volume.loc[self.crypto][0]
+        cash_on_hand = self.account.cash
+        crypto_on_hand = self.account.position(self.crypto)
         open_position = self.check_openPosition(crypto_on_hand)
         return cash_on_hand, crypto_on_hand, open_position
 
@@ -136,8 +212,7 @@ class Bot:
             logging.info(f'Placed order for {self.affordable_shares} shares at {self.current_price}...')
             # Wait for it to fill or expire:
             logging.info('Waiting for order to fill...')
-            while len(self.api.get_open_orders()) > 0:
-                time.sleep(3)
+            self.orders.track(buy_order['result']['txid'][0], symbol=self.crypto, side='buy').result()
             completed_order = self.api.get_closed_orders()[0].loc[buy_order['result']['txid'][0]]
             return buy_order, completed_order
         else:
@@ -155,6 +230,8 @@ class Bot:
                                                          'volume': self.crypto_on_hand})
         if len(stop_loss_order['error']) == 0:
             logging.info(f'Placed stop loss order {stop_loss_price}.')
+            # Followed until it fills or exit_logic cancels it, so its fill reaches the account state:
+            self.orders.track(stop_loss_order['result']['txid'][0], symbol=self.crypto, side='sell', resting=True)
             return
         else:
             logging.info(f"Stop loss order error: {stop_loss_order['error'][0]}")
@@ -184,8 +261,7 @@ class Bot:
             logging.info(f'Placed order to sell {self.crypto_on_hand} shares at {self.current_price}.')
             # Wait for it to fill or expire:
             logging.info('Waiting for order to fill...')
-            while len(self.api.get_open_orders()) > 0:
-                time.sleep(3)
+            self.orders.track(sell_order['result']['txid'][0], symbol=self.crypto, side='sell').result()
             completed_order = self.api.get_closed_orders()[0].loc[sell_order['result']['txid'][0]]
             return sell_order, completed_order
         else:
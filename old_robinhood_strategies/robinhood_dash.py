@@ -1,4 +1,7 @@
 ### Libraries
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for backtesting (see README)
 import pandas as pd
 import sqlite3
 import datetime
@@ -8,11 +11,14 @@ import dash_table
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objs as go
+from backtesting.downsample import lttb, ohlc_buckets
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
 ### Constants
 DB_NAME = 'crypto_trading'
 sql = '''SELECT * FROM history_log;'''
+MAX_CANDLES = 1000 # Candles are merged beyond this
+MAX_POINTS = 2000 # Points per indicator line
 
 
 ### Helper Functions:
@@ -27,6 +33,13 @@ def load_sqlite_data(sql, DB_NAME):
     df['time_close'] = pd.to_datetime(df['time_close']).dt.tz_convert('US/Central')
     return df
 
+def indicator_line(df, col, **kwargs):
+
+    '''A line graph of one history_log column, downsampled with LTTB.'''
+
+    keep = lttb(df[col].to_numpy(dtype='float64'), MAX_POINTS)
+    return go.Scatter(x=pd.to_datetime(df['time_period_start'].iloc[keep]), y=df[col].iloc[keep], mode='lines', **kwargs)
+
 ### Build the Web App:
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
@@ -34,11 +47,14 @@ app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 def load_layout():
     df = load_sqlite_data(sql, DB_NAME)
 
-    candle_fig = go.Figure(data=[go.Candlestick(x=df['time_period_start'],
-                    open=df['price_open'],
-                    high=df['price_high'],
-                    low=df['price_low'],
-                    close=df['price_close'])])
+    # Merge candles so the chart stays responsive on long histories:
+    starts, price_open, price_high, price_low, price_close = ohlc_buckets(df['price_open'].to_numpy(), df['price_high'].to_numpy(),
+                                                                          df['price_low'].to_numpy(), df['price_close'].to_numpy(), MAX_CANDLES)
+    candle_fig = go.Figure(data=[go.Candlestick(x=df['time_period_start'].iloc[starts],
+                    open=price_open,
+                    high=price_high,
+                    low=price_low,
+                    close=price_close)])
 
     markdown_text = '''
     # ETH Trading Bot Dashboard
@@ -64,17 +80,11 @@ def load_layout():
                     dcc.Graph(
                         figure = {
                             'data': [
-                                go.Scatter(
-                                x = pd.to_datetime(df['time_period_start']),
-                                y = df['macd_current'],
-                                mode = 'lines',
+                                indicator_line(df, 'macd_current',
                                 name='MACD (12, 26)',
                                 line=dict(color='purple', width=2)
                                             ),
-                                go.Scatter(
-                                x = pd.to_datetime(df['time_period_start']),
-                                y = df['macd_signal_current'],
-                                mode = 'lines',
+                                indicator_line(df, 'macd_signal_current',
                                 name = 'MACD Signal (9)',
                                 line=dict(color='grey', width=2, dash='dash')
                                             )
@@ -93,24 +103,15 @@ def load_layout():
                     dcc.Graph(
                         figure = {
                             'data': [
-                                go.Scatter(
-                                x = pd.to_datetime(df['time_period_start']),
-                                y = df['adx_current'],
-                                mode = 'lines',
+                                indicator_line(df, 'adx_current',
                                 name='ADX (12)',
                                 line=dict(color='black', width=2, dash='dash')
                                             ),
-                                go.Scatter(
-                                x = pd.to_datetime(df['time_period_start']),
-                                y = df['di_plus_current'],
-                                mode = 'lines',
+                                indicator_line(df, 'di_plus_current',
                                 name = 'DI Plus (12)',
                                 line=dict(color='green', width=2)
                                             ),
-                                go.Scatter(
-                                x = pd.to_datetime(df['time_period_start']),
-                                y = df['di_minus_current'],
-                                mode = 'lines',
+                                indicator_line(df, 'di_minus_current',
                                 name = 'DI Minus (12)',
                                 line=dict(color='red', width=2)
                                             )